@@ -0,0 +1 @@
+from instruments.metadata import snapshot
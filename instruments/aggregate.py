@@ -0,0 +1,267 @@
+# Multi-resolution rolling statistics of scalar measurements
+#
+# For days-long logs (K2182a.get_voltage, Egg5210.get_x, K2400.readval...), an Aggregator keeps,
+# for each time bucket at several resolutions (default 1 s, 1 min, 1 h), the count, mean,
+# standard deviation (Welford / Chan updates), minimum and maximum of the samples. Each
+# resolution is a ring buffer of fixed capacity, so memory is constant whatever the duration,
+# and a query over a week reads a few hundred hourly buckets instead of millions of samples.
+#
+# Example:
+#   agg = aggregate.Aggregator()
+#   monitor = aggregate.Monitor({"v": k2182a.get_voltage}, period=0.5, aggregators={"v": agg})
+#   monitor.start()
+#   ...
+#   agg.query(time.time() - 7 * 86400)          # hourly buckets of the last week
+#   agg.summary(time.time() - 3600)             # statistics of the last hour
+
+import threading
+import time
+
+import numpy as np
+
+# (bucket width in s, number of buckets kept): 1 s for 1 h, 1 min for 1 week, 1 h for 1 year
+DEFAULT_RESOLUTIONS = ((1.0, 3600), (60.0, 7 * 24 * 60), (3600.0, 365 * 24))
+
+_FIELDS = ("count", "mean", "std", "min", "max")
+
+
+class _Level(object):
+    def __init__(self, width, capacity):
+        self.width = width
+        self.capacity = capacity
+        self.bucket = np.full(capacity, -1, dtype=np.int64)  # bucket number held by each slot
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.mean = np.zeros(capacity)
+        self.m2 = np.zeros(capacity)  # sum of squared deviations from the mean
+        self.min = np.full(capacity, np.inf)
+        self.max = np.full(capacity, -np.inf)
+
+    def _claim(self, slots, buckets):
+        # slots holding an older bucket (ring wrapped) are reset
+        stale = self.bucket[slots] < buckets
+        if np.any(stale):
+            s = slots[stale]
+            self.bucket[s] = buckets[stale]
+            self.count[s] = 0
+            self.mean[s] = 0.0
+            self.m2[s] = 0.0
+            self.min[s] = np.inf
+            self.max[s] = -np.inf
+
+    def add(self, t, x):
+        k = int(t // self.width)
+        i = k % self.capacity
+        if self.bucket[i] > k:
+            return  # late sample, older than the buckets kept: its slot holds a newer bucket
+        if self.bucket[i] != k:
+            self.bucket[i] = k
+            self.count[i] = 0
+            self.mean[i] = 0.0
+            self.m2[i] = 0.0
+            self.min[i] = np.inf
+            self.max[i] = -np.inf
+        # Welford update
+        n = self.count[i] + 1
+        delta = x - self.mean[i]
+        self.mean[i] += delta / n
+        self.m2[i] += delta * (x - self.mean[i])
+        self.count[i] = n
+        if x < self.min[i]:
+            self.min[i] = x
+        if x > self.max[i]:
+            self.max[i] = x
+
+    def add_many(self, t, x):
+        k = np.floor_divide(t, self.width).astype(np.int64)
+        buckets, inverse = np.unique(k, return_inverse=True)
+        nb = np.bincount(inverse).astype(np.int64)
+        mb = np.bincount(inverse, weights=x) / nb
+        m2b = np.bincount(inverse, weights=(x - mb[inverse]) ** 2)
+        lo = np.full(len(buckets), np.inf)
+        hi = np.full(len(buckets), -np.inf)
+        np.minimum.at(lo, inverse, x)
+        np.maximum.at(hi, inverse, x)
+        # a batch longer than the ring only keeps its last ``capacity`` buckets
+        keep = buckets > buckets[-1] - self.capacity
+        buckets, nb, mb, m2b, lo, hi = buckets[keep], nb[keep], mb[keep], m2b[keep], lo[keep], hi[keep]
+        slots = buckets % self.capacity
+        # late buckets, whose slot already holds a newer bucket, are dropped
+        keep = self.bucket[slots] <= buckets
+        if not np.all(keep):
+            buckets, nb, mb, m2b, lo, hi, slots = (
+                buckets[keep], nb[keep], mb[keep], m2b[keep], lo[keep], hi[keep], slots[keep]
+            )
+        self._claim(slots, buckets)
+        # Chan et al. merge of the batch statistics into the buckets
+        na = self.count[slots]
+        ma = self.mean[slots]
+        n = na + nb
+        delta = mb - ma
+        self.mean[slots] = ma + delta * nb / n
+        self.m2[slots] += m2b + delta ** 2 * na * nb / n
+        self.count[slots] = n
+        self.min[slots] = np.minimum(self.min[slots], lo)
+        self.max[slots] = np.maximum(self.max[slots], hi)
+
+    def select(self, t0, t1):
+        k0 = int(t0 // self.width)
+        k1 = int(t1 // self.width)
+        k0 = max(k0, k1 - self.capacity + 1)
+        buckets = np.arange(k0, k1 + 1, dtype=np.int64)
+        slots = buckets % self.capacity
+        valid = (self.bucket[slots] == buckets) & (self.count[slots] > 0)
+        return buckets[valid], slots[valid]
+
+
+class Aggregator(object):
+    def __init__(self, resolutions=DEFAULT_RESOLUTIONS):
+        """``resolutions``: ``(bucket width in s, number of buckets kept)`` from finest to coarsest"""
+        self.levels = [_Level(width, capacity) for width, capacity in resolutions]
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<Aggregator({0})>".format(", ".join("{0:g} s x {1}".format(l.width, l.capacity) for l in self.levels))
+
+    @property
+    def nbytes(self):
+        return sum(
+            a.nbytes for l in self.levels for a in (l.bucket, l.count, l.mean, l.m2, l.min, l.max)
+        )
+
+    def add(self, value, t=None):
+        """Adds one sample taken at time ``t`` (default: now, as time.time())"""
+        t = time.time() if t is None else t
+        value = float(value)
+        with self._lock:
+            for level in self.levels:
+                level.add(t, value)
+
+    def add_many(self, values, t):
+        """Adds samples ``values`` taken at times ``t`` (arrays, e.g. a K2400 buffer), vectorized"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        t = np.broadcast_to(np.asarray(t, dtype=np.float64), values.shape)
+        if not len(values):
+            return
+        order = np.argsort(t, kind="stable")
+        values, t = values[order], t[order]
+        with self._lock:
+            for level in self.levels:
+                level.add_many(t, values)
+
+    def _level(self, t0, t1, resolution, max_points):
+        if resolution is not None:
+            for level in self.levels:
+                if level.width == resolution:
+                    return level
+            raise ValueError("No resolution {0} s in {1}".format(resolution, self))
+        now = time.time() if t1 is None else t1
+        for level in self.levels:
+            # finest resolution still covering t0 and giving at most max_points buckets
+            covers = now - t0 <= level.width * level.capacity
+            if covers and (now - t0) / level.width <= max_points:
+                return level
+        return self.levels[-1]
+
+    def query(self, t0, t1=None, resolution=None, max_points=2000):
+        """Returns the buckets between times ``t0`` and ``t1`` (default: now) as a dictionary of arrays
+        ``time`` (bucket start), ``count``, ``mean``, ``std``, ``min``, ``max``.
+        ``resolution``: bucket width in s, by default the finest one covering the range in ``max_points`` buckets.
+        """
+        t1 = time.time() if t1 is None else t1
+        with self._lock:
+            level = self._level(t0, t1, resolution, max_points)
+            buckets, slots = level.select(t0, t1)
+            count = level.count[slots].copy()
+            out = {
+                "time": buckets * level.width,
+                "count": count,
+                "mean": level.mean[slots].copy(),
+                "std": np.sqrt(level.m2[slots] / np.maximum(count - 1, 1)),
+                "min": level.min[slots].copy(),
+                "max": level.max[slots].copy(),
+                "resolution": level.width,
+            }
+        return out
+
+    def summary(self, t0, t1=None, resolution=None):
+        """Statistics (count, mean, std, min, max) of all samples between ``t0`` and ``t1``, merged from the buckets"""
+        b = self.query(t0, t1, resolution)
+        n = b["count"].sum()
+        if n == 0:
+            return {"count": 0, "mean": np.nan, "std": np.nan, "min": np.nan, "max": np.nan}
+        mean = np.sum(b["count"] * b["mean"]) / n
+        m2 = np.sum(b["std"] ** 2 * np.maximum(b["count"] - 1, 0)) + np.sum(b["count"] * (b["mean"] - mean) ** 2)
+        return {
+            "count": int(n),
+            "mean": mean,
+            "std": np.sqrt(m2 / max(n - 1, 1)),
+            "min": b["min"].min(),
+            "max": b["max"].max(),
+        }
+
+    def save(self, filename):
+        with self._lock:
+            arrays = {}
+            for i, l in enumerate(self.levels):
+                arrays.update(
+                    {
+                        "{0}_{1}".format(name, i): getattr(l, name)
+                        for name in ("bucket", "count", "mean", "m2", "min", "max")
+                    }
+                )
+                arrays["width_{0}".format(i)] = l.width
+            np.savez(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            n = sum(1 for key in f.files if key.startswith("width_"))
+            agg = cls([(float(f["width_{0}".format(i)]), len(f["bucket_{0}".format(i)])) for i in range(n)])
+            for i, l in enumerate(agg.levels):
+                for name in ("bucket", "count", "mean", "m2", "min", "max"):
+                    setattr(l, name, f["{0}_{1}".format(name, i)].copy())
+        return agg
+
+
+class Monitor(object):
+    def __init__(self, sources, period=1.0, aggregators=None):
+        """Background thread calling every function of ``sources`` (``{name: function}``) every ``period`` s
+        and adding the values to ``aggregators[name]`` (created if not given).
+        """
+        self.sources = dict(sources)
+        self.period = period
+        self.aggregators = dict(aggregators or {})
+        for name in self.sources:
+            self.aggregators.setdefault(name, Aggregator())
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __getitem__(self, name):
+        return self.aggregators[name]
+
+    def _run(self):
+        next_time = time.monotonic()
+        while not self._stop.is_set():
+            for name, source in self.sources.items():
+                try:
+                    value = source()
+                    t = time.time()
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Monitor: {name} failed: {e}")
+                    continue
+                self.aggregators[name].add(value, t)
+            next_time += self.period
+            self._stop.wait(max(0.0, next_time - time.monotonic()))
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
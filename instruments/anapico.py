@@ -70,7 +70,7 @@ class AnaPico(instr.Instr):
         if debug is True:
             print(f"Writing {command}")
             print(f'Before:\n {self.debug_status()}')
-        self.visa_instr.write(command)
+        instr.Instr.write(self, command)
         if debug is True:
             print(f'After:\n {self.debug_status()}')
 
@@ -79,10 +79,10 @@ class AnaPico(instr.Instr):
         if debug is True:
             print(f"Querying {command}")
             print(f'Before:\n {self.debug_status()}')
-        self.visa_instr.query(command)
+        instr.Instr.query(self, command)
         if debug is True:
             print(f'After:\n {self.debug_status()}')
-        return self.visa_instr.query(command)
+        return instr.Instr.query(self, command)
 
 
     @property
@@ -187,6 +187,19 @@ class AnaPico(instr.Instr):
         else:
             ERR("parameter for output() must be None (query), True or False (set)")
 
+    def get_metadata(self):
+        """Returns frequency, power and output state of the current channel, using a single compound query."""
+        # instr.Instr.query: a single exchange (self.query sends every command twice)
+        values = instr.Instr.query(
+            self, f":FREQ:FIX?;:POW?;:OUTP{self._current_channel}?"
+        ).split(';')
+        return {
+            'channel': self._current_channel,
+            'freq': float(values[0]),
+            'power': float(values[1]),
+            'output': values[2] == "1",
+        }
+
     def unit_power(self, unit=None):
         possible_units = ["W", "V", "DBM", "DB"]
         if unit is None:
@@ -0,0 +1,218 @@
+# Checkpoint and resume of long sweeps
+#
+# A Checkpoint iterates over the points of a sweep and records which ones are completed.
+# The record (completed indices as ranges, next point, instrument settings) is written
+# atomically to a JSON file by a background thread every ``interval`` seconds, so the
+# acquisition loop never waits for the disk. Per-point results passed to done() are saved
+# by the same thread (one .npz file per point). When the script is run again after a crash,
+# completed points are skipped, the settings recorded at the start are re-applied by ``apply``
+# (if given) and compared with the current ones, and the sweep resumes at the first unmeasured
+# point. A sweep is never resumed with different settings: start() raises instead.
+#
+# Example:
+#   freqs = np.linspace(4e9, 8e9, 401)
+#   with checkpoint.Checkpoint("map.ckpt", freqs, drivers={"znb": znb, "egg": egg}) as ckpt:
+#       for i, f in ckpt:
+#           anapico.freq(f)
+#           ckpt.done(i, egg.get_x_quick())
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from instruments import metadata
+
+
+def _key(points):
+    # identifies the sweep: a checkpoint is only resumed for the same list of points
+    return hashlib.sha1(repr([repr(p) for p in points]).encode()).hexdigest()
+
+
+def _to_ranges(indices):
+    ranges = []
+    for i in sorted(indices):
+        if ranges and ranges[-1][1] == i:
+            ranges[-1][1] = i + 1
+        else:
+            ranges.append([i, i + 1])
+    return ranges
+
+
+def _from_ranges(ranges):
+    return {i for start, stop in ranges for i in range(start, stop)}
+
+
+def _to_json(obj):
+    if hasattr(obj, "item"):
+        return obj.item()
+    return repr(obj)
+
+
+class Checkpoint(object):
+    def __init__(self, path, points, drivers=None, apply=None, interval=10.0, results=True):
+        """Sweep over ``points`` (any sequence) checkpointed in file ``path``.
+        ``drivers``: ``{name: driver}`` whose settings (``get_metadata()``) are recorded at the start of the sweep.
+        ``apply``: function called with the recorded settings when resuming, to re-apply them. Without it,
+        resuming raises ValueError if the current settings differ from the recorded ones.
+        ``interval``: seconds between two writes of the checkpoint file.
+        ``results``: if True, results passed to ``done()`` are saved in directory ``path + ".results"``.
+        """
+        self.path = path
+        self.points = list(points)
+        self.drivers = drivers or {}
+        self.apply = apply
+        self.interval = interval
+        self.results_dir = path + ".results" if results else None
+        self.completed = set()
+        self.settings = None
+        self.resumed = False
+        self._key = _key(self.points)
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+        self._results = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def __repr__(self):
+        return "<Checkpoint({0}, {1}/{2} points done)>".format(self.path, len(self.completed), len(self.points))
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return
+        if record.get("key") != self._key:
+            raise ValueError(
+                "Checkpoint {0} belongs to another sweep; delete it or choose another path".format(self.path)
+            )
+        self.completed = _from_ranges(record["completed"])
+        self.settings = record.get("settings")
+        self.resumed = True
+
+    @property
+    def cursor(self):
+        """Index of the next unmeasured point (len(points) when the sweep is complete)"""
+        i = 0
+        while i in self.completed:
+            i += 1
+        return i
+
+    def _record(self):
+        with self._lock:
+            completed = _to_ranges(self.completed)
+        return {
+            "key": self._key,
+            "n_points": len(self.points),
+            "completed": completed,
+            "cursor": self.cursor,
+            "settings": self.settings,
+            "time": time.time(),
+        }
+
+    def save(self):
+        """Writes the checkpoint file now (atomically) and the pending results"""
+        # completed points are read before the results are written: every point recorded as
+        # completed has its result on disk (done() queues the result before marking the point)
+        record = self._record()
+        self._save_results()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(record, f, default=_to_json)
+        os.replace(tmp, self.path)
+
+    def _save_results(self):
+        while True:
+            try:
+                index, result = self._results.get_nowait()
+            except queue.Empty:
+                return
+            arrays = result if isinstance(result, tuple) else (result,)
+            np.savez(os.path.join(self.results_dir, "{0:08d}.npz".format(index)), *arrays)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self._dirty.is_set():
+                self._dirty.clear()
+                try:
+                    self.save()
+                except Exception as e:
+                    print(f"Cannot write checkpoint {self.path}: {e}")
+
+    def _restore_settings(self):
+        if self.settings is None:
+            return
+        if self.apply is not None:
+            self.apply(self.settings)
+        if not self.drivers:
+            return
+        current = metadata.snapshot(self.drivers)
+        differences = []
+        for name in self.drivers:
+            before = json.loads(json.dumps(self.settings.get(name), default=_to_json))
+            after = json.loads(json.dumps(current.get(name), default=_to_json))
+            if before != after:
+                differences.append(f"{name}:\n  was {before}\n  now {after}")
+        if differences:
+            raise ValueError(
+                "Cannot resume {0}: settings differ from the checkpoint{1} (re-apply them, "
+                "or pass ``apply``):\n{2}".format(
+                    self.path, " after apply" if self.apply is not None else "", "\n".join(differences)
+                )
+            )
+
+    def start(self):
+        """Records the settings (new sweep) or restores them (resumed sweep) and starts the writer thread"""
+        if self.resumed:
+            self._restore_settings()
+        elif self.drivers:
+            self.settings = {k: v for k, v in metadata.snapshot(self.drivers).items() if k != "time"}
+        if self.results_dir is not None:
+            os.makedirs(self.results_dir, exist_ok=True)
+        self.save()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="checkpoint", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stops the writer thread and writes the checkpoint a last time"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.save()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        """Yields ``(index, point)`` for the points not completed yet, in order"""
+        for i, point in enumerate(self.points):
+            if i not in self.completed:
+                yield i, point
+
+    def done(self, index, result=None):
+        """Marks point ``index`` as completed; ``result`` (array or tuple of arrays) is saved in the background"""
+        if result is not None and self.results_dir is not None:
+            self._results.put((index, result))
+        with self._lock:
+            self.completed.add(index)
+        self._dirty.set()
+
+    def result(self, index):
+        """Loads the result saved for point ``index`` (a tuple of arrays)"""
+        with np.load(os.path.join(self.results_dir, "{0:08d}.npz".format(index))) as f:
+            return tuple(f["arr_{0}".format(i)] for i in range(len(f.files)))
+
+    def complete(self):
+        return len(self.completed) == len(self.points)
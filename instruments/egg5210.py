@@ -16,7 +16,8 @@ TIMEOUT_NORMAL = 10. # (s)
 import instr
 import importlib
 importlib.reload(instr)
-from time import sleep, time
+from instruments import gpib_bus
+from time import sleep, time, perf_counter
 from math import log10, floor
 import numpy as np
 
@@ -28,6 +29,9 @@ def rangecode_to_range(code):
 
 
 class Egg5210(instr.Instr):
+	# no warm restart: identifying the instrument (ID) and confirming a saved state would take as
+	# many STB handshakes as reading the sensitivity and time constant (SEN, TC)
+
 	def __init__(self, visa_name, visa_library=''):
 		super(Egg5210, self).__init__(visa_name, visa_library)
 		self.visa_instr.read_termination = "\r"
@@ -122,12 +126,20 @@ class Egg5210(instr.Instr):
 	# 	return out
 
 	def write(self,command):
-		return self.communicate(command)
+		return self.communicate(command, priority=gpib_bus.PRIORITY_CONTROL)
 
 	def query(self,command):
 		return self.communicate(command)
 
-	def communicate(self,command):
+	def communicate(self, command, priority=gpib_bus.PRIORITY_NORMAL):
+		# the STB handshake below spans many bus operations: hold the GPIB board for all of them
+		with self.transaction(priority):
+			t0 = perf_counter()
+			ret = self._communicate(command)
+			self.metrics.observe("communicate", perf_counter() - t0)
+			return ret
+
+	def _communicate(self,command):
 		if command.startswith(('ANR ', 'AQN ', 'AS ', 'ASM ', 'ATS ', 'AXO ')):
 			timeout = TIMEOUT_LONG
 		else:
@@ -139,33 +151,34 @@ class Egg5210(instr.Instr):
 		
 		while time()-t0 < timeout:
 			try:
-				sb = self.visa_instr.read_stb()
+				sb = self.read_stb()
 				assert sb & 0b10000111 == 0b00000001
 			except:
 				print(f"Before command {command}: \tsb={sb}")
 				if sb & 0b10000000 == 0b10000000:
-					out = self.visa_instr.read()
+					out = instr.Instr.read(self)
 					print(f"Reading leftover data before command: value={out}")
 			else:
 				break
 			finally:
 				sleep(TAU)
 
-		sb = self.visa_instr.read_stb()
+		sb = self.read_stb()
 		if (sb & 0b10000011 != 0b00000001):
+			self.metrics.error(timeout=True)
 			raise RuntimeError(f"ERROR cannot reset STB before sending command ({command})")
 
-		self.visa_instr.write(command)
+		instr.Instr.write(self, command)
 		sleep(TAU)
 
-		sb = self.visa_instr.read_stb()
+		sb = self.read_stb()
 
 		t0 = time()
 		while (sb & 0b00000001 == 0b00000000) & ( time()-t0 < timeout ):
-			sb = self.visa_instr.read_stb()
+			sb = self.read_stb()
 			sleep(TAU)
 			if sb & 0b10000000 == 0b10000000:
-				ret += self.visa_instr.read()
+				ret += instr.Instr.read(self)
 
 		if sb & 0b00000100 == 0b00000100:
 			raise RuntimeError(f"ERROR parameter error ({command})")
@@ -176,6 +189,7 @@ class Egg5210(instr.Instr):
 			ret = None
 
 		if sb & 0b00000001 == 0b00000000:
+			self.metrics.error(timeout=True)
 			raise RuntimeError(f"ERROR command not complete. Timeout ({timeout:.3f}s).")
 			ret = None
 
@@ -191,7 +205,7 @@ class Egg5210(instr.Instr):
 
 	# SHOULD BE GOOD
 	def is_command_complete(self):
-		status = self.visa_instr.read_stb()
+		status = self.read_stb()
 		# print("{0:08b}".format(status))
 		if status & 0b00000001 == 0b00000001:
 			return True
@@ -203,7 +217,7 @@ class Egg5210(instr.Instr):
 
 	# SHOULD BE GOOD
 	def is_data_available(self):
-		status = self.visa_instr.read_stb()
+		status = self.read_stb()
 		# print("{0:08b}".format(status))
 		if status & 0b10000000 == 0b10000000:
 			return True
@@ -214,7 +228,7 @@ class Egg5210(instr.Instr):
 			return RETURN_ERROR
 
 	def is_overload(self):
-		status = self.visa_instr.read_stb()
+		status = self.read_stb()
 		# print("{0:08b}".format(status))
 		if status & 0b00010000 == 0b00010000:
 			return True
@@ -225,7 +239,7 @@ class Egg5210(instr.Instr):
 			return RETURN_ERROR
 
 	def is_unlock(self):
-		status = self.visa_instr.read_stb()
+		status = self.read_stb()
 		# print("{0:08b}".format(status))
 		if status & 0b00001000 == 0b00001000:
 			return True
@@ -360,6 +374,15 @@ class Egg5210(instr.Instr):
 
 
 
+	def get_metadata(self):
+		"""
+		Returns sensitivity and time constant (the 5210 has no compound queries:
+		both are read within one bus transaction)
+		"""
+		with self.transaction():
+			return {"sensitivity": self.get_sensitivity(), "timeconstant": self.get_timeconstant()}
+
+
 	def get_frequency(self):
 		"""
 		returns the frequency of reference oscillator
@@ -422,8 +445,9 @@ class Egg5210(instr.Instr):
 		"""
 		Gets X value with minimal overhead, for frequent readings. Less reliability checks but quicker.
 		"""
-		self.visa_instr.write_raw("*")
-		out = self.visa_instr.read()
+		with self.transaction():
+			self.write_raw(b"*")
+			out = instr.Instr.read(self)
 		return np.float(out)*self.fullscale/10000
 
 
@@ -0,0 +1,301 @@
+# Run-time estimation of measurement plans
+#
+# A plan is a set of nested loops (e.g. a 2D map: 51 field values x 201 frequencies) and the
+# steps done at each level (set a field, wait for a lock-in, fetch a sweep...). Each step has a
+# cost model built from instrument settings and, when available, from the latencies measured
+# by the driver metrics (see metrics.py). The estimate gives the total duration, the time spent
+# in each step and the bottleneck, and what_if() shows the effect of changing a parameter
+# (number of points, IF bandwidth, averaging...).
+#
+# Example:
+#   plan = estimate.Plan(shape=(51, 201))
+#   plan.add(estimate.Command(anapico, "write"), level=1)           # step the frequency
+#   plan.add(estimate.EggSettle.from_driver(egg), level=1)          # 5 tau + readout
+#   plan.add(estimate.ZnbSweep.from_driver(znb), level=0)           # one sweep per line
+#   plan.report()
+#   plan.what_if("ZnbSweep", averages=10)
+
+import copy
+
+# typical latency (s) of a VISA command when the driver has not measured any yet
+DEFAULT_LATENCY = 5e-3
+
+
+def mean_latency(driver, operation, default=DEFAULT_LATENCY):
+    """Mean latency (s) of ``operation`` ("query", "write", "communicate"...) measured by the driver metrics"""
+    histogram = getattr(getattr(driver, "metrics", None), "latency", {}).get(operation)
+    if histogram is None or histogram.count == 0:
+        return default
+    return histogram.sum / histogram.count
+
+
+def transfer_rate(driver, operation="query_binary_values", default=None):
+    """Measured transfer rate (bytes/s) of the ``operation`` calls of the driver (bytes they transferred
+    over their total latency), ``default`` if not measured
+    """
+    m = getattr(driver, "metrics", None)
+    if m is None:
+        return default
+    histogram = m.latency.get(operation)
+    nbytes = m.bytes.get(operation, 0)
+    if histogram is None or histogram.sum == 0 or nbytes == 0:
+        return default
+    return nbytes / histogram.sum
+
+
+class Model(object):
+    """Cost of one step: ``duration()`` in seconds. Parameters are instance attributes."""
+
+    instrument = None
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+    def duration(self):
+        raise NotImplementedError
+
+    def but(self, **changes):
+        """Returns a copy of the model with some parameters changed (for what-if estimates)"""
+        other = copy.copy(self)
+        for key, value in changes.items():
+            if not hasattr(other, key):
+                raise AttributeError("{0} has no parameter {1}".format(self.name, key))
+            setattr(other, key, value)
+        return other
+
+    def __repr__(self):
+        params = ", ".join(
+            "{0}={1!r}".format(k, v) for k, v in vars(self).items() if not k.startswith("_")
+        )
+        return "<{0}({1})>".format(self.name, params)
+
+
+class Fixed(Model):
+    def __init__(self, seconds, name="Fixed", instrument=None):
+        """Fixed duration (a sleep in the script, a magnet ramp...)"""
+        self.seconds = seconds
+        self._name = name
+        self.instrument = name if instrument is None else instrument
+
+    @property
+    def name(self):
+        return self._name
+
+    def duration(self):
+        return self.seconds
+
+
+class Command(Model):
+    def __init__(self, driver, operation="query", count=1, latency=None):
+        """``count`` VISA ``operation`` of ``driver``; latency measured by its metrics unless given"""
+        self.instrument = getattr(driver, "visa_name", str(driver))
+        self.operation = operation
+        self.count = count
+        self.latency = mean_latency(driver, operation) if latency is None else latency
+
+    @property
+    def name(self):
+        return "{0}.{1}".format(self.instrument, self.operation)
+
+    def duration(self):
+        return self.count * self.latency
+
+
+class ZnbSweep(Model):
+    def __init__(self, points, if_bw, averages=1, sweep_time=None, latency=DEFAULT_LATENCY,
+                 transfer_rate=1e6, instrument="Znb"):
+        """One (averaged) VNA sweep and its transfer.
+        ``sweep_time``: time of one sweep at ``points`` and ``if_bw`` as reported by the instrument;
+        if None, estimated as ``points / if_bw``. Changing ``points`` or ``if_bw`` scales it.
+        ``transfer_rate`` (bytes/s): complex data, 8 bytes per point in REAL,32.
+        """
+        self.instrument = instrument
+        self.points = points
+        self.if_bw = if_bw
+        self.averages = averages
+        self.latency = latency
+        self.transfer_rate = transfer_rate
+        # reference point of the measured sweep time
+        self._reference = (sweep_time, points, if_bw)
+
+    @classmethod
+    def from_driver(cls, znb):
+        rate = transfer_rate(znb, default=1e6)
+        return cls(
+            znb.get_nb_points(),
+            znb.VBW,
+            max(1, int(znb.averaging)),
+            sweep_time=znb.sweep_time,
+            latency=mean_latency(znb, "query"),
+            transfer_rate=rate,
+            instrument=znb.visa_name,
+        )
+
+    def sweep_time(self):
+        sweep_time, points, if_bw = self._reference
+        if sweep_time is None:
+            return self.points / self.if_bw
+        return sweep_time * (self.points / points) * (if_bw / self.if_bw)
+
+    def duration(self):
+        return self.averages * self.sweep_time() + 8 * self.points / self.transfer_rate + 2 * self.latency
+
+
+class YokoRecord(Model):
+    def __init__(self, record_length, srate, channels=1, bytes_per_point=2, transfer_rate=1e6,
+                 latency=DEFAULT_LATENCY, queries=8, instrument="Yoko750"):
+        """Acquisition of ``record_length`` points at ``srate`` and binary download of ``channels`` traces.
+        ``transfer_rate`` (bytes/s) is best taken from the driver metrics (see ``from_driver``).
+        ``queries``: setting queries per downloaded trace.
+        """
+        self.instrument = instrument
+        self.record_length = record_length
+        self.srate = srate
+        self.channels = channels
+        self.bytes_per_point = bytes_per_point
+        self.transfer_rate = transfer_rate
+        self.latency = latency
+        self.queries = queries
+
+    @classmethod
+    def from_driver(cls, yoko, channels=None):
+        return cls(
+            yoko.record_length(),
+            float(yoko.query(":TIM:SRAT?")),
+            channels=len(yoko.active_traces) if channels is None else channels,
+            transfer_rate=transfer_rate(yoko, default=1e6),
+            latency=mean_latency(yoko, "query"),
+            instrument=yoko.visa_name,
+        )
+
+    def duration(self):
+        acquisition = self.record_length / self.srate
+        download = self.channels * (
+            self.record_length * self.bytes_per_point / self.transfer_rate + self.queries * self.latency
+        )
+        return acquisition + download
+
+
+class EggSettle(Model):
+    def __init__(self, timeconstant, n_tau=5, readings=1, latency=0.3, instrument="Egg5210"):
+        """Lock-in settling (``n_tau`` time constants) then ``readings`` readouts (full STB handshakes)"""
+        self.instrument = instrument
+        self.timeconstant = timeconstant
+        self.n_tau = n_tau
+        self.readings = readings
+        self.latency = latency
+
+    @classmethod
+    def from_driver(cls, egg, n_tau=5, readings=1):
+        return cls(
+            egg.timeconstant,
+            n_tau,
+            readings,
+            latency=mean_latency(egg, "communicate", default=0.3),
+            instrument=egg.visa_name,
+        )
+
+    def duration(self):
+        return self.n_tau * self.timeconstant + self.readings * self.latency
+
+
+class K2400Point(Model):
+    def __init__(self, nplc=1.0, source_delay=0.0, line_frequency=50.0, readings=1, latency=DEFAULT_LATENCY,
+                 instrument="K2400"):
+        """One source-measure point: source delay then ``readings`` integrations of ``nplc`` power line cycles"""
+        self.instrument = instrument
+        self.nplc = nplc
+        self.source_delay = source_delay
+        self.line_frequency = line_frequency
+        self.readings = readings
+        self.latency = latency
+
+    @classmethod
+    def from_driver(cls, k2400, function="CURR"):
+        return cls(
+            k2400.query_ascii_values(":SENS:{0}:NPLC?".format(function))[0],
+            k2400.query_ascii_values(":SOUR:DEL?")[0],
+            k2400.line_frequency(),
+            latency=mean_latency(k2400, "query"),
+            instrument=k2400.visa_name,
+        )
+
+    def duration(self):
+        return self.source_delay + self.readings * self.nplc / self.line_frequency + 2 * self.latency
+
+
+class Plan(object):
+    def __init__(self, shape):
+        """Nested loops of sizes ``shape`` (outermost first), e.g. ``(51, 201)`` for a 2D map"""
+        self.shape = tuple(shape)
+        self.steps = []  # (model, level, group)
+
+    def add(self, model, level=-1, group=None):
+        """Adds a step done at each iteration of loop ``level`` (default: innermost, i.e. every point).
+        Steps with the same ``group`` run concurrently (e.g. in a pipeline): the group costs its slowest step.
+        """
+        if level < 0:
+            level += len(self.shape)
+        if not 0 <= level < len(self.shape):
+            raise ValueError("level must index shape {0}".format(self.shape))
+        self.steps.append((model, level, group))
+        return model
+
+    def repetitions(self, level):
+        n = 1
+        for size in self.shape[: level + 1]:
+            n *= size
+        return n
+
+    def estimate(self, steps=None):
+        """Returns ``{"total": s, "steps": {name: s}, "instruments": {instrument: s}, "bottleneck": ...}``"""
+        steps = self.steps if steps is None else steps
+        per_step = {}
+        per_instrument = {}
+        groups = {}
+        total = 0.0
+        for model, level, group in steps:
+            t = self.repetitions(level) * model.duration()
+            per_step[model.name] = per_step.get(model.name, 0.0) + t
+            per_instrument[model.instrument] = per_instrument.get(model.instrument, 0.0) + t
+            if group is None:
+                total += t
+            else:
+                groups[group] = max(groups.get(group, 0.0), t)
+        total += sum(groups.values())
+        bottleneck = max(per_instrument, key=per_instrument.get) if per_instrument else None
+        return {
+            "total": total,
+            "steps": per_step,
+            "instruments": per_instrument,
+            "bottleneck": bottleneck,
+        }
+
+    def what_if(self, step, shape=None, **changes):
+        """Estimate with the parameters of step ``step`` (name or model) changed, and/or another ``shape``"""
+        steps = [
+            (model.but(**changes) if model is step or model.name == step else model, level, group)
+            for model, level, group in self.steps
+        ]
+        if shape is None:
+            return self.estimate(steps)
+        other = Plan(shape)
+        other.steps = steps
+        return other.estimate()
+
+    def report(self, estimate=None):
+        """Prints the estimate: total duration and the share of each step"""
+        e = self.estimate() if estimate is None else estimate
+        print("Plan {0}: {1} points, {2}".format(self.shape, self.repetitions(len(self.shape) - 1), _hms(e["total"])))
+        for name, t in sorted(e["steps"].items(), key=lambda kv: -kv[1]):
+            share = 100 * t / e["total"] if e["total"] else 0
+            print("  {0:<40} {1:>12}  {2:5.1f} %".format(name, _hms(t), share))
+        print("Bottleneck: {0}".format(e["bottleneck"]))
+        return e
+
+
+def _hms(seconds):
+    h, rest = divmod(int(round(seconds)), 3600)
+    m, s = divmod(rest, 60)
+    return "{0:d}:{1:02d}:{2:02d}".format(h, m, s)
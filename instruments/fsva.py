@@ -27,7 +27,7 @@ class Fsva(instr.Instr):
     # JLS : float (4 bytes) resolution is not enough for narrow-band
     #f = self.visa_instr.query_binary_values(f'TRAC:X? TRACE{tracenum:d}', datatype='f', is_big_endian=False)
     f = self.get_frequencies()
-    s = self.visa_instr.query_binary_values(f'TRAC? TRACE{tracenum:d}', datatype='f', is_big_endian=False)
+    s = self.query_binary_values(f'TRAC? TRACE{tracenum:d}', datatype='f', is_big_endian=False)
     return np.array(f), np.array(s)
 
   def get_frequencies(self):
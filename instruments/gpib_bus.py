@@ -0,0 +1,134 @@
+# Arbitration of a GPIB board shared by several instruments
+#
+# Every instrument opened on the same board (e.g. GPIB0::12::INSTR and GPIB0::8::INSTR)
+# gets the same BusArbiter. A driver wraps each multi-step exchange (write + STB polling + read)
+# in a transaction so that no other instrument talks on the bus in the middle of it.
+# Transactions are reentrant for the thread holding the bus, and waiting transactions are
+# granted by priority (lower value first), then in arrival order.
+
+import re
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+PRIORITY_CONTROL = 0  # short commands (set a value, send a trigger)
+PRIORITY_NORMAL = 1  # ordinary queries
+PRIORITY_BULK = 2  # long data transfers
+
+_arbiters = {}
+_arbiters_lock = threading.Lock()
+
+
+def board_name(visa_name):
+    """Returns the GPIB board of a VISA resource name ('GPIB0' for 'GPIB0::12::INSTR' or 'GPIB::12'),
+    or None if the resource is not on a GPIB bus.
+    """
+    match = re.match(r"\s*GPIB(\d*)::", visa_name.upper())
+    if match is None:
+        return None
+    return "GPIB{0}".format(match.group(1) or "0")
+
+
+def arbiter_for(visa_name):
+    """Returns the arbiter shared by all instruments on the same GPIB board as ``visa_name``,
+    or None for non-GPIB resources.
+    """
+    board = board_name(visa_name)
+    if board is None:
+        return None
+    with _arbiters_lock:
+        if board not in _arbiters:
+            _arbiters[board] = BusArbiter(board)
+        return _arbiters[board]
+
+
+class BusArbiter(object):
+    def __init__(self, board):
+        self.board = board
+        self._condition = threading.Condition(threading.Lock())
+        self._owner_thread = None
+        self._depth = 0
+        self._waiting = []  # (priority, ticket) of blocked transactions
+        self._ticket = 0
+        self.reset_statistics()
+
+    def __repr__(self):
+        return "<BusArbiter({0})>".format(self.board)
+
+    def _acquire(self, priority):
+        me = threading.get_ident()
+        with self._condition:
+            if self._owner_thread == me:
+                self._depth += 1
+                return False
+            self._ticket += 1
+            entry = (priority, self._ticket)
+            self._waiting.append(entry)
+            while self._owner_thread is not None or min(self._waiting) != entry:
+                self._condition.wait()
+            self._waiting.remove(entry)
+            self._owner_thread = me
+            self._depth = 1
+            return True
+
+    def _release(self):
+        with self._condition:
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner_thread = None
+                self._condition.notify_all()
+                return True
+            return False
+
+    @contextmanager
+    def transaction(self, priority=PRIORITY_NORMAL, owner=None):
+        """Context manager holding the bus for the duration of the block.
+        Nested transactions of the same thread are part of the outer one.
+        """
+        t_request = perf_counter()
+        outermost = self._acquire(priority)
+        t_start = perf_counter()
+        try:
+            yield self
+        finally:
+            if self._release() and outermost:
+                self._account(owner, t_start - t_request, perf_counter() - t_start)
+
+    def _account(self, owner, wait, busy):
+        with self._condition:
+            self._busy_time += busy
+            self._wait_time += wait
+            self._transactions += 1
+            stats = self._per_owner.setdefault(
+                owner,
+                {"transactions": 0, "busy_time": 0.0, "wait_time": 0.0, "max_wait": 0.0},
+            )
+            stats["transactions"] += 1
+            stats["busy_time"] += busy
+            stats["wait_time"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+
+    def reset_statistics(self):
+        with self._condition:
+            self._t0 = perf_counter()
+            self._busy_time = 0.0
+            self._wait_time = 0.0
+            self._transactions = 0
+            self._per_owner = {}
+
+    def statistics(self):
+        """Returns bus usage since creation or last ``reset_statistics()``:
+        elapsed time, busy time and utilization (busy/elapsed), total waiting time,
+        number of transactions, and the same figures per instrument (``per_instrument``).
+        """
+        with self._condition:
+            elapsed = perf_counter() - self._t0
+            return {
+                "board": self.board,
+                "elapsed": elapsed,
+                "busy_time": self._busy_time,
+                "utilization": self._busy_time / elapsed if elapsed > 0 else 0.0,
+                "wait_time": self._wait_time,
+                "transactions": self._transactions,
+                "per_instrument": {k: dict(v) for k, v in self._per_owner.items()},
+            }
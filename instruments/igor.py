@@ -0,0 +1,149 @@
+# Igor Pro export
+#
+# write_ibw() writes an Igor binary wave (.ibw, version 5, single precision float) and
+# write_itx() an Igor text file (.itx) with several waves as columns. Both stream the data
+# by blocks: values can be given as raw codes with their ``(gain, offset)`` scale (as kept by
+# trace.Trace), so exporting long records needs no full-size float copy.
+#
+# Example:
+#   igor.write_ibw("ch1.ibw", tr.codes, "run1_CH1", dx=1 / tr.srate, scale=tr.scale, note=str(tr.metadata()))
+
+import struct
+import time
+
+import numpy as np
+
+NT_FP32 = 2  # Igor number type of single precision floats
+
+_BIN_HEADER5 = struct.Struct("<hhiiii4i4iiii")  # 64 bytes
+_WAVE_HEADER5 = struct.Struct(
+    "<iIIihh6sh32sii4i4d4d4s16shhddi4i4ii16ihhhcciihhii"
+)  # 320 bytes
+_IGOR_EPOCH = 2082844800  # seconds between 1904-01-01 (Igor dates) and 1970-01-01
+
+BLOCK = 1 << 20  # points converted at a time
+
+
+def _checksum(header):
+    # the 16-bit sum of the headers, checksum included, must be zero
+    return -int(np.frombuffer(header, dtype="<i2").sum(dtype=np.int64)) & 0xFFFF
+
+
+def _units(unit):
+    # units up to 3 characters fit in the wave header, longer ones go in the extended units
+    unit = unit.encode("latin-1")
+    return (unit, b"") if len(unit) <= 3 else (b"", unit)
+
+
+def _blocks(data, scale, dtype, block=BLOCK):
+    data = np.asarray(data).ravel()
+    gain, offset = (1.0, 0.0) if scale is None else scale
+    buffer = np.empty(min(block, len(data)), dtype=dtype)
+    for start in range(0, len(data), block):
+        chunk = data[start : start + block]
+        out = buffer[: len(chunk)]
+        out[...] = chunk
+        if scale is not None:
+            out *= out.dtype.type(gain)
+            out += out.dtype.type(offset)
+        yield out
+
+
+def write_ibw(filename, data, name, dx=1.0, x0=0.0, x_unit="s", data_unit="V", note="", scale=None):
+    """Writes ``data`` (1D) as the Igor binary wave ``name`` (.ibw version 5, single precision).
+    ``dx``, ``x0``, ``x_unit``: x scaling; ``data_unit``: unit of the values; ``note``: wave note.
+    ``scale``: ``(gain, offset)`` if ``data`` are raw codes (values = codes * gain + offset), converted by blocks.
+    """
+    data = np.asarray(data)
+    npnts = data.size
+    note = note.encode("latin-1", "replace")
+    data_units, data_eunits = _units(data_unit)
+    x_units, x_eunits = _units(x_unit)
+    now = int(time.time()) + _IGOR_EPOCH
+    wave_header = _WAVE_HEADER5.pack(
+        0,  # next
+        now,  # creationDate
+        now,  # modDate
+        npnts,
+        NT_FP32,  # type
+        0,  # dLock
+        b"",  # whpad1
+        1,  # whVersion
+        name.encode("latin-1")[:31],  # bname
+        0,  # whpad2
+        0,  # dFolder
+        npnts, 0, 0, 0,  # nDim
+        dx, 1.0, 1.0, 1.0,  # sfA
+        x0, 0.0, 0.0, 0.0,  # sfB
+        data_units,
+        x_units,  # dimUnits (first dimension, the others empty)
+        0,  # fsValid
+        0,  # whpad3
+        0.0,  # topFullScale
+        0.0,  # botFullScale
+        0,  # dataEUnits
+        0, 0, 0, 0,  # dimEUnits
+        0, 0, 0, 0,  # dLabels
+        0,  # waveNoteH
+        *([0] * 16),  # whUnused
+        0,  # aModified
+        0,  # wModified
+        0,  # swModified
+        b"\0",  # useBits
+        b"\0",  # kindBits
+        0,  # formula
+        0,  # depID
+        0,  # whpad4
+        0,  # srcFldr
+        0,  # fileName
+        0,  # sIndices
+    )
+    bin_header = _BIN_HEADER5.pack(
+        5,  # version
+        0,  # checksum, computed below
+        _WAVE_HEADER5.size + 4 * npnts,  # wfmSize: wave header and data
+        0,  # formulaSize
+        len(note),
+        len(data_eunits),
+        len(x_eunits), 0, 0, 0,  # dimEUnitsSize
+        0, 0, 0, 0,  # dimLabelsSize
+        0,  # sIndicesSize
+        0,  # optionsSize1
+        0,  # optionsSize2
+    )
+    checksum = _checksum(bin_header + wave_header)
+    bin_header = bin_header[:2] + struct.pack("<H", checksum) + bin_header[4:]
+    with open(filename, "wb") as f:
+        f.write(bin_header)
+        f.write(wave_header)
+        for block in _blocks(data, scale, "<f4"):
+            f.write(block.tobytes())
+        # after the data: formula (none), note, extended units
+        f.write(note)
+        f.write(data_eunits)
+        f.write(x_eunits)
+
+
+def write_itx(filename, columns, names, scales=None, fmt="% .8e", commands="", block=BLOCK // 8):
+    """Writes the waves ``names`` (columns of equal length) in the Igor text file ``filename``.
+    ``scales``: ``(gain, offset)`` of each column given as raw codes (None for values).
+    ``commands``: Igor commands executed after loading (lines starting with ``X``), e.g. SetScale.
+    """
+    columns = [np.asarray(c).ravel() for c in columns]
+    scales = [None] * len(columns) if scales is None else list(scales)
+    n = len(columns[0]) if columns else 0
+    # one % formatting of the whole block instead of one per row (np.savetxt)
+    row = "\t".join([fmt] * len(columns)) + "\n"
+    with open(filename, "w", newline="\n") as f:
+        f.write("IGOR\nWAVES\t" + "\t".join(names) + "\nBEGIN\n")
+        table = np.empty((min(block, n), len(columns)))
+        for start in range(0, n, block):
+            rows = table[: min(block, n - start)]
+            for j, (column, scale) in enumerate(zip(columns, scales)):
+                rows[:, j] = column[start : start + len(rows)]
+                if scale is not None:
+                    rows[:, j] *= scale[0]
+                    rows[:, j] += scale[1]
+            f.write(row * len(rows) % tuple(rows.ravel().tolist()))
+        f.write("END\n")
+        f.write(commands)
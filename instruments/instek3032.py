@@ -152,4 +152,41 @@ class Instek3032(instr.Instr):
         if voltage_unit.lower() in ["vpp", "vrms", "dbm"]:
             self.write(f"SOURce{self.current_channel}:VOLTage:UNIT {voltage_unit}")
         else : 
-            raise ValueError("Unit must be 'Vpp', 'Vrms' or 'dBm' (case insensitive)")
\ No newline at end of file
+            raise ValueError("Unit must be 'Vpp', 'Vrms' or 'dBm' (case insensitive)")
+
+# ----------- burst mode (current channel)
+
+    @property
+    def burst(self):
+        self.__burst = self.query(f"SOURce{self.current_channel}:BURSt:STATe?").strip() in ["1", "ON"]
+        return self.__burst
+
+    @burst.setter
+    def burst(self, state):
+        self.write(f"SOURce{self.current_channel}:BURSt:STATe {'ON' if state else 'OFF'}")
+
+    @property
+    def burst_cycles(self):
+        self.__burst_cycles = int(float(self.query(f"SOURce{self.current_channel}:BURSt:NCYCles?")))
+        return self.__burst_cycles
+
+    @burst_cycles.setter
+    def burst_cycles(self, n):
+        self.write(f"SOURce{self.current_channel}:BURSt:NCYCles {int(n)}")
+
+    @property
+    def burst_source(self):
+        self.__burst_source = self.query(f"SOURce{self.current_channel}:BURSt:TRIGger:SOURce?")
+        return self.__burst_source
+
+    @burst_source.setter
+    def burst_source(self, source):
+        if source.upper() in ["IMM", "IMMEDIATE", "EXT", "EXTERNAL", "MAN", "MANUAL"]:
+            self.write(f"SOURce{self.current_channel}:BURSt:MODE TRIGgered")
+            self.write(f"SOURce{self.current_channel}:BURSt:TRIGger:SOURce {source}")
+        else :
+            raise ValueError("Burst trigger source must be 'IMMediate', 'EXTernal' or 'MANual' (case insensitive)")
+
+    def trigger(self):
+        """Starts one burst (burst trigger source 'MANual')"""
+        self.write("*TRG")
@@ -1,14 +1,103 @@
 import pyvisa as visa
-from time import sleep
+from time import sleep, time, perf_counter
+from contextlib import nullcontext
+from instruments import gpib_bus
+from instruments import memory
+from instruments import metrics
+from instruments import state_cache
+from instruments import tracing
+
+
+# I/O errors after which the session is cleared and reopened (timeout, connection lost...)
+RECOVERABLE_ERRORS = (visa.errors.VisaIOError, visa.errors.InvalidSession)
+
+# session settings restored on the reopened session
+SESSION_ATTRIBUTES = (
+    "timeout",
+    "read_termination",
+    "write_termination",
+    "send_end",
+    "query_delay",
+    "chunk_size",
+    "baud_rate",
+    "parity",
+    "stop_bits",
+    "flow_control",
+    "data_bits",
+)
+
+# queries that change the instrument state (clear an event register, pop the error queue) or wait for an
+# operation that a device clear aborts: never repeated after a recovery unless retry=True is passed
+NOT_RETRIED = ("*OPC", "*ESR", "STAT:EEV", "STATUS:EEV", "STAT:ERR", "STATUS:ERR", "SYST:ERR", "SYSTEM:ERR")
+
+
+def is_retryable(command):
+    """True if every message unit of ``command`` is a read-only query (repeated once after a recovery)"""
+    units = [unit.strip().lstrip(":").upper() for unit in command.split(";")]
+    return all(
+        unit and unit.split()[0].endswith("?") and not unit.startswith(NOT_RETRIED) for unit in units
+    )
+
+
+class _Session(object):
+    """VISA resource remembering the session settings set on it (SESSION_ATTRIBUTES), so that
+    recover() restores them on the reopened session without reading the failed one.
+    """
+
+    def __init__(self, resource, settings):
+        object.__setattr__(self, "resource", resource)
+        object.__setattr__(self, "settings", settings)
+
+    @classmethod
+    def open(cls, resource_manager, visa_name, settings=None):
+        """Opens ``visa_name`` and applies ``settings`` (default: caches the settings of the new session)"""
+        resource = resource_manager.open_resource(visa_name)
+        if settings is None:
+            settings = {}
+            for name in SESSION_ATTRIBUTES:
+                try:
+                    settings[name] = getattr(resource, name)
+                except Exception:
+                    pass
+        else:
+            for name, value in settings.items():
+                setattr(resource, name, value)
+        return cls(resource, dict(settings))
+
+    def __getattr__(self, name):
+        return getattr(self.resource, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.resource, name, value)
+        if name in SESSION_ATTRIBUTES:
+            self.settings[name] = value
 
 
 class Instr(object):
+    # session recovery: number of reopening attempts, first and maximal delay between attempts (s)
+    auto_recover = True
+    recovery_attempts = 5
+    recovery_backoff = (0.1, 5.0)
+    # False for instruments that a device clear resets
+    clear_on_recovery = True
+
+    # bytes of data the driver may retain (last traces...), None: only the budget shared by all drivers applies
+    memory_budget = None
+
+    # attributes saved by clean() and restored by load_state() at the next construction
+    persistent_state = ()
+
     def __str__(self):
         return "VISA instrument on resource {0}".format(self.visa_name)
 
     def __repr__(self):
         return "VISA instrument on resource  {0}".format(self.visa_name)
 
+    def __init_subclass__(cls, **kwargs):
+        # public driver methods appear as spans in tracing timelines
+        super().__init_subclass__(**kwargs)
+        tracing.trace_public_methods(cls)
+
     # def __new__(self):
     #     return self
 
@@ -16,20 +105,63 @@ class Instr(object):
         self.visa_name = visa_name
         self.visa_library = visa_library
         self.visa_resource_manager = visa.ResourceManager(self.visa_library)
-        self.visa_instr = self.visa_resource_manager.open_resource(self.visa_name)
+        self.visa_instr = _Session.open(self.visa_resource_manager, self.visa_name)
         self.visa_instr.timeout = 5000  # ms
         # self.visa_instr.values_format = "ascii"
         # self.visa_instr.lock = NI_NO_LOCK
         print("Instrument initialized.")
         print("VISA resource: {0}".format(self.visa_name))
+        # instruments on the same GPIB board share one arbiter (None for other interfaces)
+        self.bus = gpib_bus.arbiter_for(self.visa_name)
+        self.recoveries = []  # one dictionary per session recovery (time, duration, attempts, error)
+        self._recovering = False
+        self.metrics = metrics.Metrics(self.visa_name)
+        self.memory = memory.MemoryAccount(self.visa_name, self.memory_budget)
         self._clean = False
 
+    @tracing.untraced
+    def transaction(self, priority=gpib_bus.PRIORITY_NORMAL):
+        """Context manager making a multi-step exchange atomic on a shared GPIB board.
+        Use for any sequence (write, polling, read) that must not be interleaved with
+        another instrument's traffic. No effect for non-GPIB resources.
+        """
+        if self.bus is None:
+            return nullcontext()
+        return self.bus.transaction(priority, owner=self.visa_name)
+
     def clean(self):
+        self.save_state()
         self.visa_instr.clear()
         self.visa_instr.close()
         self._clean = True
         print(f"VISA instrument released ({self.visa_name}).")
 
+    def get_persistent_state(self):
+        return {name: getattr(self, name) for name in self.persistent_state}
+
+    def set_persistent_state(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def save_state(self):
+        """Saves the attributes listed in ``persistent_state`` for a warm restart"""
+        if not self.persistent_state:
+            return
+        try:
+            state_cache.save(self.visa_name, getattr(self, "idn", None), self.get_persistent_state())
+        except Exception as e:
+            print(f"Cannot save state of {self.visa_name}: {e}")
+
+    def load_state(self, idn=None):
+        """Restores the state saved by the last ``clean()`` on this resource (and with the same ``idn`` if given).
+        Returns True if a state was restored. The driver must still validate it against the instrument.
+        """
+        state = state_cache.load(self.visa_name, idn)
+        if state is None:
+            return False
+        self.set_persistent_state(state)
+        return True
+
     def __del__(self):
         if not self._clean:
             self.clean()
@@ -37,25 +169,101 @@ class Instr(object):
         # del self.visa_resource_manager
 
     def get_idn(self):
-        IDN = self.visa_instr.query("*IDN?")
+        IDN = self.query("*IDN?")
         return IDN
 
+    def _io(self, method, *args, retry=False, priority=gpib_bus.PRIORITY_NORMAL, **kwargs):
+        """Calls ``self.visa_instr.<method>(*args, **kwargs)`` as one bus transaction.
+        After an I/O error the session is recovered, then the call is repeated once if ``retry``
+        (idempotent queries only), otherwise the error is raised on the recovered session.
+        """
+        with self.transaction(priority):
+            try:
+                return self._timed_io(method, args, kwargs)
+            except RECOVERABLE_ERRORS as e:
+                if not self.auto_recover or self._recovering:
+                    raise
+                self.recover(e)
+                if not retry:
+                    raise
+            return self._timed_io(method, args, kwargs)
+
+    def _timed_io(self, method, args, kwargs):
+        t0 = perf_counter()
+        try:
+            result = getattr(self.visa_instr, method)(*args, **kwargs)
+        except RECOVERABLE_ERRORS as e:
+            self.metrics.error(timeout=getattr(e, "error_code", None) == visa.constants.VI_ERROR_TMO)
+            raise
+        finally:
+            recorder = tracing._recorder
+            if recorder is not None:
+                name = method if not args or not isinstance(args[0], str) else f"{method} {args[0][:40]}"
+                recorder.add(name, "visa", t0, perf_counter(), {"instrument": self.visa_name})
+        self.metrics.observe(method, perf_counter() - t0, metrics.payload_size(method, args, result, kwargs))
+        return result
+
+    def recover(self, error=None):
+        """Clears and reopens the VISA session, then restores terminations, timeout and chunk size
+        (the last values set, not read back from the failed session) and calls ``_on_recovery()``.
+        Reopening is tried ``recovery_attempts`` times with exponential backoff. Returns the recovery time (s),
+        also recorded in ``recoveries``.
+        """
+        t0 = perf_counter()
+        settings = self.visa_instr.settings
+        delay = self.recovery_backoff[0]
+        self._recovering = True
+        try:
+            for attempt in range(1, self.recovery_attempts + 1):
+                try:
+                    if self.clear_on_recovery:
+                        try:
+                            self.visa_instr.clear()
+                        except Exception:
+                            pass
+                    try:
+                        self.visa_instr.close()
+                    except Exception:
+                        pass
+                    self.visa_instr = _Session.open(self.visa_resource_manager, self.visa_name, settings)
+                    break
+                except RECOVERABLE_ERRORS:
+                    if attempt == self.recovery_attempts:
+                        raise
+                    sleep(delay)
+                    delay = min(2 * delay, self.recovery_backoff[1])
+        finally:
+            self._recovering = False
+        self._on_recovery()
+        duration = perf_counter() - t0
+        self.metrics.reconnect()
+        self.recoveries.append(
+            {"time": time(), "duration": duration, "attempts": attempt, "error": repr(error)}
+        )
+        print(f"VISA session recovered in {duration:.3f} s ({self.visa_name}): {error!r}")
+        return duration
+
+    def _on_recovery(self):
+        """Called after recover() reopened (and possibly cleared) the session: drivers forget here the
+        instrument settings they cache (formats, windows...), which may no longer hold.
+        """
+
     def clear(self):
-        self.visa_instr.clear()
+        self._io("clear")
         print("Instrument cleared.")
 
     def cls(self):  # SCPI equivalent of (py-)VISA command clear() ?
-        self.visa_instr.write("*CLS")
+        self._io("write", "*CLS", priority=gpib_bus.PRIORITY_CONTROL)
         return "*CLS command sent."
 
     def reset(self):
         # Reset the instrument
-        self.visa_instr.write("*RST")
+        self._io("write", "*RST", priority=gpib_bus.PRIORITY_CONTROL)
         return "*RST command sent."
 
     def get_control_port(self):
         # NOT NECESSARY IF USING GPIB OR LAN CONNEXION WITH VXI-11 INSTEAD OF SOCKETS
-        bla = self.visa_instr.query("SYSTem:COMMunicate:TCPip:CONTrol?")
+        bla = self._io("query", "SYSTem:COMMunicate:TCPip:CONTrol?", retry=True)
         try:
             output = int(bla)
         except:
@@ -64,24 +272,47 @@ class Instr(object):
         return output
 
     def trigger(self):
-        self.visa_instr.assert_trigger()
+        self._io("assert_trigger", priority=gpib_bus.PRIORITY_CONTROL)
         return "Trigger sent."
 
     def write(self, command):
         # print("Writing {0}".format(command))
-        self.visa_instr.write(command)
+        self._io("write", command, priority=gpib_bus.PRIORITY_CONTROL)
 
     def read(self):
         # print("Reading...")
-        return self.visa_instr.read()
+        return self._io("read")
 
-    def query(self, command, **kwargs):
+    # retry: repeat the query once on the recovered session (see _io()). None (default): only read-only
+    # queries (is_retryable), pass retry=False for a query whose answer depends on settings lost by a device clear
+    def query(self, command, retry=None, **kwargs):
         # print("Querying {0}...".format(command))
-        return self.visa_instr.query(command, **kwargs)
+        return self._io("query", command, retry=is_retryable(command) if retry is None else retry, **kwargs)
 
-    def query_ascii_values(self, command, **kwargs):
+    def query_ascii_values(self, command, retry=None, **kwargs):
         # print("Querying {0}...".format(command))
-        return self.visa_instr.query_ascii_values(command, **kwargs)
+        return self._io(
+            "query_ascii_values", command, retry=is_retryable(command) if retry is None else retry, **kwargs
+        )
+
+    def query_binary_values(self, command, retry=None, **kwargs):
+        return self._io(
+            "query_binary_values",
+            command,
+            retry=is_retryable(command) if retry is None else retry,
+            priority=gpib_bus.PRIORITY_BULK,
+            **kwargs
+        )
+
+    def write_raw(self, message):
+        self._io("write_raw", message, priority=gpib_bus.PRIORITY_CONTROL)
+
+    def read_raw(self, **kwargs):
+        return self._io("read_raw", priority=gpib_bus.PRIORITY_BULK, **kwargs)
+
+    def read_stb(self):
+        # not repeated: a status byte read after a device clear would no longer reflect the handshake
+        return self._io("read_stb")
 
     def prepare_for_stb(self):
         # Clear the instrument's Status Byte
@@ -90,7 +321,7 @@ class Instr(object):
         # Event Status Register, so that when that bit's value transitions from 0 to 1
         # then the Event Status Register bit in the Status Byte (bit 5 of that byte)
         # will become set.
-        self.visa_instr.write("*ESE 1")
+        self._io("write", "*ESE 1")
         return "OPC bit enabled (*ESE 1)."
 
     def prepare_for_srq(self):
@@ -100,20 +331,21 @@ class Instr(object):
         # Event Status Register, so that when that bit's value transitions from 0 to 1
         # then the Event Status Register bit in the Status Byte (bit 5 of that byte)
         # will become set.
-        self.visa_instr.write("*ESE 1")
+        self._io("write", "*ESE 1")
         # Enable for bit 5 (which has weight 32) in the Status Byte to generate an
         # SRQ when that bit's value transitions from 0 to 1.
-        self.visa_instr.write("*SRE 32")
+        self._io("write", "*SRE 32")
         print("OPC bit enabled (*ESE 1). Enable generation of SRQ (*SRE 32).")
 
     def wait_opc(self):
-        self.visa_instr.query("*OPC?")
+        # not repeated: *OPC? after a device clear would report an operation complete that was aborted
+        self._io("query", "*OPC?")
 
     def wait_for_stb(self):
-        self.visa_instr.write("*OPC")
+        self.write("*OPC")
         done = False
         while not (done):
-            bla = self.visa_instr.query("*STB?")
+            bla = self.query("*STB?")
             try:
                 stb_value = int(bla)
             except:
@@ -123,5 +355,8 @@ class Instr(object):
                 sleep(0.01)
 
     def wait_for_srq(self):  # ONLY WORKS WITH GPIB ! NOT TESTED !
-        self.visa_instr.write("*OPC")
-        self.visa_instr.wait_for_srq(10)
+        self._io("write", "*OPC")
+        self._io("wait_for_srq", 10)
+
+
+tracing.trace_public_methods(Instr)
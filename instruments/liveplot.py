@@ -0,0 +1,191 @@
+# Live plotting of long traces decimated to screen resolution
+#
+# A 1e8-point Yoko750 record cannot be handed to matplotlib, but a screen only shows a few
+# thousand columns. The functions below reduce a trace to that resolution:
+#   - minmax(): minimum and maximum of every column (the envelope: no glitch is hidden);
+#   - lttb(): Largest-Triangle-Three-Buckets, a subset of the points that keeps the visual shape.
+# Both work on raw int16 codes: scaling to volts is applied to the few output points only.
+#
+# LiveView keeps one matplotlib line and updates its data in place:
+#   - append(chunk): chunks of a record as they are downloaded (incremental min/max envelope
+#     with constant memory: the bin width doubles when the record outgrows the screen);
+#   - update(y): a new sweep replacing the previous one (Znb, Zvk, Fsva).
+#
+# Example:
+#   view = liveplot.LiveView(scale=(rang * 10 / 24000, offs), dt=1 / srate)
+#   for codes in chunks:
+#       view.append(codes)
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+
+def _scaled(y, scale):
+    if scale is None:
+        return y
+    gain, offset = scale
+    return y * gain + offset
+
+
+def minmax(y, width=2000, x=None):
+    """Returns ``(x, y)`` of the min/max envelope of ``y`` over ``width`` columns (2 points per column).
+    ``x`` defaults to the sample index. The dtype of ``y`` is kept (e.g. int16 codes).
+    """
+    y = np.asarray(y)
+    n = len(y)
+    if n <= 2 * width:
+        return (np.arange(n) if x is None else np.asarray(x)), y
+    size = -(-n // width)  # samples per column
+    full = n // size
+    blocks = y[: full * size].reshape(full, size)
+    lo = blocks.min(axis=1)
+    hi = blocks.max(axis=1)
+    if full * size < n:
+        lo = np.append(lo, y[full * size :].min())
+        hi = np.append(hi, y[full * size :].max())
+    starts = np.arange(len(lo)) * size
+    centers = np.minimum(starts + size // 2, n - 1)
+    xs = centers if x is None else np.asarray(x)[centers]
+    return np.repeat(xs, 2), np.column_stack((lo, hi)).ravel()
+
+
+def lttb(y, n_out=2000, x=None):
+    """Returns ``(x, y)`` of ``n_out`` points of ``y`` chosen with the Largest-Triangle-Three-Buckets method.
+    Each bucket is processed with vectorized operations; the loop runs over the ``n_out`` buckets only.
+    """
+    y = np.asarray(y)
+    n = len(y)
+    if x is None:
+        x = np.arange(n)
+    else:
+        x = np.asarray(x)
+    if n <= n_out or n_out < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)  # n_out - 2 buckets between first and last
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # average point of the next bucket (last point for the last bucket)
+        if i + 2 < len(edges):
+            nxt = slice(edges[i + 1], edges[i + 2])
+            cx = x[nxt].mean()
+            cy = y[nxt].astype(np.float64).mean()
+        else:
+            cx, cy = x[-1], float(y[-1])
+        xa, ya = float(x[a]), float(y[a])
+        area = np.abs((xa - cx) * (y[lo:hi] - ya) - (xa - x[lo:hi]) * (cy - ya))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return x[selected], y[selected]
+
+
+class Envelope(object):
+    def __init__(self, width=2000):
+        """Incremental min/max envelope of a stream of chunks, at most ``2 * width`` columns whatever the length"""
+        self.width = width
+        self.size = 1  # samples per column, doubled when the number of columns exceeds 2 * width
+        self.count = 0  # samples received
+        self.lo = np.array([])
+        self.hi = np.array([])
+        self._rest = (0, None, None)  # samples, min and max of the last incomplete column
+
+    def append(self, chunk):
+        chunk = np.asarray(chunk)
+        if not len(chunk):
+            return
+        self.count += len(chunk)
+        n, lo, hi = self._rest
+        if n:
+            # complete the last column first
+            head, chunk = chunk[: self.size - n], chunk[self.size - n :]
+            lo, hi = min(lo, head.min()), max(hi, head.max())
+            n += len(head)
+            if n < self.size:
+                self._rest = (n, lo, hi)
+                return
+            self.lo = np.append(self.lo, lo).astype(np.result_type(lo, head))
+            self.hi = np.append(self.hi, hi).astype(np.result_type(hi, head))
+        full = len(chunk) // self.size
+        if full:
+            blocks = chunk[: full * self.size].reshape(full, self.size)
+            self.lo = np.concatenate((self.lo, blocks.min(axis=1))) if len(self.lo) else blocks.min(axis=1)
+            self.hi = np.concatenate((self.hi, blocks.max(axis=1))) if len(self.hi) else blocks.max(axis=1)
+        rest = chunk[full * self.size :]
+        self._rest = (len(rest), rest.min(), rest.max()) if len(rest) else (0, None, None)
+        while len(self.lo) > 2 * self.width:
+            self._merge()
+
+    def _merge(self):
+        # pairs of columns merged: memory and output size stay bounded
+        even = len(self.lo) // 2 * 2
+        if even < len(self.lo):
+            # odd last column and incomplete column form the new incomplete column
+            n, lo, hi = self._rest
+            if n:
+                lo, hi = min(lo, self.lo[-1]), max(hi, self.hi[-1])
+            else:
+                lo, hi = self.lo[-1], self.hi[-1]
+            self._rest = (n + self.size, lo, hi)
+        self.lo = np.minimum(self.lo[0:even:2], self.lo[1:even:2])
+        self.hi = np.maximum(self.hi[0:even:2], self.hi[1:even:2])
+        self.size *= 2
+
+    def data(self, dt=1.0, t0=0.0):
+        """Returns ``(x, y)`` of the envelope, ``x`` in units of ``dt`` from ``t0``"""
+        lo, hi = self.lo, self.hi
+        n, rest_lo, rest_hi = self._rest
+        if n:
+            lo = np.append(lo, rest_lo)
+            hi = np.append(hi, rest_hi)
+        centers = np.minimum(np.arange(len(lo)) * self.size + self.size // 2, max(self.count - 1, 0))
+        return np.repeat(t0 + centers * dt, 2), np.column_stack((lo, hi)).ravel()
+
+
+class LiveView(object):
+    def __init__(self, ax=None, width=2000, method="minmax", scale=None, dt=1.0, t0=0.0, **line_kwargs):
+        """Line in ``ax`` (new figure if None) showing a decimated trace.
+        ``method``: "minmax" (envelope) or "lttb" for update(); append() always uses the envelope.
+        ``scale``: ``(gain, offset)`` applied to the decimated points (e.g. Yoko750 codes to volts).
+        ``dt``, ``t0``: x axis of appended chunks (sample period and start).
+        """
+        if method not in ("minmax", "lttb"):
+            raise ValueError('method must be "minmax" or "lttb"')
+        if ax is None:
+            _, ax = plt.subplots()
+        self.ax = ax
+        self.width = width
+        self.method = method
+        self.scale = scale
+        self.dt = dt
+        self.t0 = t0
+        (self.line,) = ax.plot([], [], **line_kwargs)
+        self.envelope = Envelope(width)
+
+    def _draw(self, x, y):
+        self.line.set_data(x, _scaled(y, self.scale))
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.ax.figure.canvas.draw_idle()
+        self.ax.figure.canvas.flush_events()
+
+    def append(self, chunk):
+        """Adds the next chunk of a record (raw codes or values) and redraws the envelope"""
+        self.envelope.append(chunk)
+        self._draw(*self.envelope.data(self.dt, self.t0))
+
+    def update(self, y, x=None):
+        """Replaces the trace by a new sweep ``y`` (with abscissa ``x``, default: sample index times ``dt``)"""
+        if x is None:
+            x = self.t0 + np.arange(len(y)) * self.dt
+        if self.method == "lttb":
+            self._draw(*lttb(y, self.width, x))
+        else:
+            self._draw(*minmax(y, self.width, x))
+
+    def reset(self):
+        """Starts a new record for append()"""
+        self.envelope = Envelope(self.width)
+        self.line.set_data([], [])
@@ -75,10 +75,10 @@ class Mcdc2805(instr.Instr):
 
 
     def write(self, command, debug=False):   
-        self.visa_instr.write(command)
+        instr.Instr.write(self, command)
        
     def query(self, command, debug=False):
-        return self.visa_instr.query(command)
+        return instr.Instr.query(self, command)
 
     def __del__(self):
         self.visa_instr.close()
@@ -0,0 +1,161 @@
+# Accounting of the arrays retained by drivers (last traces, axes...)
+#
+# Every Instr has a MemoryAccount listing the arrays it keeps after returning them
+# (Zvk.f / Zvk.z, Yoko750.traces[i].y...). Each entry has a size and an eviction callback.
+# When the retained bytes exceed the budget of the instrument (Instr.memory_budget) or the
+# budget shared by all instruments (set_budget()), the least recently used entries are
+# evicted. Derived data (e.g. the time axis of a Yoko750 trace) is simply recomputed when
+# accessed again; evicted measurement data must be fetched again.
+#
+# Example:
+#   memory.set_budget(2 * 1024 ** 3)  # at most 2 GiB retained by all drivers
+#   memory.usage()                    # {"TCPIP::...": bytes, ...}
+
+import itertools
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+# budget (bytes) shared by all instruments, None for no limit
+_budget = int(os.environ["INSTRUMENTS_MEMORY_BUDGET"]) if "INSTRUMENTS_MEMORY_BUDGET" in os.environ else None
+
+_registry = weakref.WeakSet()
+_lock = threading.RLock()  # one lock for all accounts: eviction may span several instruments
+_clock = itertools.count()
+
+
+def nbytes(value):
+    """Size in bytes of an array (or tuple of arrays) retained by a driver"""
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes(v) for v in value)
+    return getattr(value, "nbytes", 0)
+
+
+def set_budget(budget):
+    """Sets the number of bytes all drivers may retain together (None for no limit) and evicts accordingly"""
+    global _budget
+    _budget = budget
+    _enforce()
+
+
+def get_budget():
+    return _budget
+
+
+def usage():
+    """Returns the bytes retained by each live instrument"""
+    with _lock:
+        return {a.owner: a.retained for a in _registry}
+
+
+def total():
+    with _lock:
+        return sum(a.retained for a in _registry)
+
+
+def _enforce(account=None):
+    # the most recently added entry of ``account`` is kept even alone over budget:
+    # data just fetched stays available until something else is retained
+    with _lock:
+        if account is not None and account.budget is not None:
+            while account.retained > account.budget and len(account._entries) > 1:
+                account._evict_oldest()
+        if _budget is not None:
+            accounts = [a for a in _registry if len(a._entries) > (a is account)]
+            # (an eviction callback may release dependent entries: the total is recomputed each time)
+            while accounts and sum(a.retained for a in _registry) > _budget:
+                # least recently used entry over all instruments
+                oldest = min(accounts, key=lambda a: next(iter(a._entries.values()))[0])
+                oldest._evict_oldest()
+                accounts = [a for a in accounts if len(a._entries) > (a is account)]
+
+
+class MemoryAccount(object):
+    def __init__(self, owner, budget=None):
+        """Retained arrays of instrument ``owner``; ``budget`` in bytes (None: only the shared budget applies)"""
+        self.owner = owner
+        self.budget = budget
+        self.retained = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (last use, nbytes, evict callback), least recently used first
+        with _lock:
+            _registry.add(self)
+
+    def __repr__(self):
+        return "<MemoryAccount({0}, {1} bytes in {2} entries)>".format(self.owner, self.retained, len(self._entries))
+
+    def add(self, key, size, evict):
+        """Registers (or updates) entry ``key`` of ``size`` bytes; ``evict()`` releases it. Evicts if over budget."""
+        with _lock:
+            if key in self._entries:
+                self.retained -= self._entries.pop(key)[1]
+            self._entries[key] = (next(_clock), size, evict)
+            self.retained += size
+            _enforce(self)
+
+    def touch(self, key):
+        """Marks entry ``key`` as recently used"""
+        with _lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (next(_clock),) + entry[1:]
+                self._entries.move_to_end(key)
+
+    def remove(self, key):
+        """Forgets entry ``key`` without calling its eviction callback"""
+        with _lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.retained -= entry[1]
+
+    def clear(self):
+        """Evicts all entries"""
+        with _lock:
+            while self._entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self):
+        key, (_, size, evict) = self._entries.popitem(last=False)
+        self.retained -= size
+        self.evictions += 1
+        evict()
+        return size
+
+    def entries(self):
+        """Returns ``{key: nbytes}`` from least to most recently used"""
+        with _lock:
+            return {key: entry[1] for key, entry in self._entries.items()}
+
+
+class CacheDict(dict):
+    """Dictionary of arrays accounted in a MemoryAccount: reading a key marks it as recently used,
+    eviction deletes the key.
+    """
+
+    def __init__(self, account, name):
+        super(CacheDict, self).__init__()
+        self.account = account
+        self.name = name
+
+    def __setitem__(self, key, value):
+        super(CacheDict, self).__setitem__(key, value)
+        self.account.add((self.name, key), nbytes(value), lambda: dict.pop(self, key, None))
+
+    def __getitem__(self, key):
+        value = super(CacheDict, self).__getitem__(key)
+        self.account.touch((self.name, key))
+        return value
+
+    def __delitem__(self, key):
+        super(CacheDict, self).__delitem__(key)
+        self.account.remove((self.name, key))
+
+    def pop(self, key, *default):
+        self.account.remove((self.name, key))
+        return super(CacheDict, self).pop(key, *default)
+
+    def clear(self):
+        for key in list(self):
+            self.account.remove((self.name, key))
+        super(CacheDict, self).clear()
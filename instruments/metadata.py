@@ -0,0 +1,49 @@
+# Whole-rack settings snapshot
+#
+# snapshot() asks every driver for its get_metadata() dictionary in parallel threads.
+# Drivers on a shared GPIB board are serialized by their bus arbiter, the others
+# (LAN, USB, RS232) are queried concurrently, so the cost is roughly that of the slowest bus.
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor(max_workers):
+    # one pool reused from point to point: thread start-up is not paid on every call
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._max_workers < max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="snapshot")
+        return _pool
+
+
+def _get_metadata(driver):
+    try:
+        return driver.get_metadata()
+    except Exception as e:
+        return {"error": repr(e)}
+
+
+def snapshot(drivers):
+    """Returns the settings of all drivers as one dictionary ``{name: metadata, ..., "time": t}``.
+    ``drivers`` is either a dictionary ``{name: driver}`` or a list of drivers (named by VISA resource).
+    Each driver is read with its ``get_metadata()`` method; a driver that fails gives ``{"error": ...}``
+    instead of interrupting the measurement.
+    """
+    if isinstance(drivers, dict):
+        items = list(drivers.items())
+    else:
+        items = [(d.visa_name, d) for d in drivers]
+    t = time.time()
+    futures = [
+        (name, _executor(max(1, len(items))).submit(_get_metadata, d)) for name, d in items
+    ]
+    out = {name: f.result() for name, f in futures}
+    out["time"] = t
+    return out
@@ -0,0 +1,265 @@
+# Per-instrument I/O metrics for long unattended runs
+#
+# Every Instr keeps a Metrics object updated by Instr._io(): number of commands, latency
+# histogram and bytes transferred per VISA operation, errors, timeouts and session
+# recoveries. Updating costs a few dictionary operations per VISA call; nothing is written
+# to disk from the measurement thread. An Exporter thread periodically writes the metrics of
+# all live instruments to a local file:
+#   - "openmetrics": text exposition format, the file is rewritten at every flush;
+#   - "jsonl": one JSON line per flush, the file is rotated when it exceeds max_bytes.
+#
+# Example:
+#   exporter = metrics.Exporter("run42.jsonl", interval=60)
+#   exporter.start()
+#   ...
+#   exporter.stop()
+
+import bisect
+import json
+import os
+import struct
+import threading
+import time
+import weakref
+
+# upper bounds (s) of the latency histogram buckets (last bucket: +Inf)
+LATENCY_BUCKETS = (
+    1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+# VISA operations counted as outgoing / incoming bytes
+_WRITE_OPERATIONS = ("write", "write_raw")
+
+_registry = weakref.WeakSet()
+_registry_lock = threading.Lock()
+
+
+def payload_size(operation, args, result, kwargs):
+    """Number of bytes sent or received by a VISA call (approximate for parsed values)"""
+    if operation in _WRITE_OPERATIONS:
+        return len(args[0]) if args else 0
+    if isinstance(result, (bytes, bytearray, str)):
+        return len(result)
+    if hasattr(result, "nbytes"):
+        return result.nbytes
+    if operation == "query_binary_values" and result is not None:
+        return len(result) * struct.calcsize(kwargs.get("datatype", "f"))
+    if isinstance(result, (list, tuple)):
+        return 8 * len(result)
+    return 0
+
+
+class Histogram(object):
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {"buckets": list(self.counts), "sum": self.sum, "count": self.count}
+
+
+class Metrics(object):
+    def __init__(self, instrument):
+        """Counters and latency histograms of the VISA resource ``instrument``"""
+        self.instrument = instrument
+        self.start_time = time.time()
+        self.commands = {}  # operation -> number of calls
+        self.latency = {}  # operation -> Histogram
+        self.bytes = {}  # operation -> bytes transferred
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.reconnects = 0
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.add(self)
+
+    def __repr__(self):
+        return "<Metrics({0})>".format(self.instrument)
+
+    def observe(self, operation, latency, nbytes=0):
+        with self._lock:
+            self.commands[operation] = self.commands.get(operation, 0) + 1
+            h = self.latency.get(operation)
+            if h is None:
+                h = self.latency[operation] = Histogram()
+            h.observe(latency)
+            self.bytes[operation] = self.bytes.get(operation, 0) + nbytes
+            if operation in _WRITE_OPERATIONS:
+                self.bytes_written += nbytes
+            else:
+                self.bytes_read += nbytes
+
+    def error(self, timeout=False):
+        with self._lock:
+            self.errors += 1
+            if timeout:
+                self.timeouts += 1
+
+    def reconnect(self):
+        with self._lock:
+            self.reconnects += 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "instrument": self.instrument,
+                "start_time": self.start_time,
+                "commands": dict(self.commands),
+                "latency": {op: h.to_dict() for op, h in self.latency.items()},
+                "bytes": dict(self.bytes),
+                "bytes_written": self.bytes_written,
+                "bytes_read": self.bytes_read,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "reconnects": self.reconnects,
+            }
+
+
+def collect():
+    """Returns the metrics of all live instruments as a list of dictionaries"""
+    with _registry_lock:
+        instances = list(_registry)
+    return [m.to_dict() for m in sorted(instances, key=lambda m: m.instrument)]
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_openmetrics(records):
+    """Formats the output of ``collect()`` in the OpenMetrics text exposition format"""
+    lines = []
+
+    def family(name, kind, help, samples):
+        lines.append("# TYPE {0} {1}".format(name, kind))
+        lines.append("# HELP {0} {1}".format(name, help))
+        lines.extend(samples)
+
+    def sample(name, labels, value):
+        text = ",".join('{0}="{1}"'.format(k, _label(v)) for k, v in labels)
+        return "{0}{{{1}}} {2}".format(name, text, repr(float(value)) if isinstance(value, float) else value)
+
+    counters = (
+        ("errors", "VISA I/O errors"),
+        ("timeouts", "VISA timeouts"),
+        ("reconnects", "VISA session recoveries"),
+    )
+    family(
+        "instruments_commands", "counter", "VISA calls",
+        [
+            sample("instruments_commands_total", (("instrument", r["instrument"]), ("operation", op)), n)
+            for r in records for op, n in sorted(r["commands"].items())
+        ],
+    )
+    family(
+        "instruments_bytes", "counter", "Bytes transferred",
+        [
+            sample("instruments_bytes_total", (("instrument", r["instrument"]), ("direction", d)), r["bytes_" + d])
+            for r in records for d in ("written", "read")
+        ],
+    )
+    family(
+        "instruments_operation_bytes", "counter", "Bytes transferred by VISA operation",
+        [
+            sample("instruments_operation_bytes_total", (("instrument", r["instrument"]), ("operation", op)), n)
+            for r in records for op, n in sorted(r.get("bytes", {}).items())
+        ],
+    )
+    for key, help in counters:
+        family(
+            "instruments_" + key, "counter", help,
+            [sample("instruments_{0}_total".format(key), (("instrument", r["instrument"]),), r[key]) for r in records],
+        )
+    samples = []
+    for r in records:
+        for op, h in sorted(r["latency"].items()):
+            labels = (("instrument", r["instrument"]), ("operation", op))
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS + (float("inf"),), h["buckets"]):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append(sample("instruments_latency_seconds_bucket", labels + (("le", le),), cumulative))
+            samples.append(sample("instruments_latency_seconds_count", labels, h["count"]))
+            samples.append(sample("instruments_latency_seconds_sum", labels, float(h["sum"])))
+    family("instruments_latency_seconds", "histogram", "VISA call latency", samples)
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+class Exporter(object):
+    def __init__(self, path, interval=60.0, fmt=None, max_bytes=10 * 1024 ** 2, backups=5):
+        """Periodically writes ``collect()`` to ``path`` from a background thread.
+        ``fmt``: "openmetrics" or "jsonl" (default: from the file extension, jsonl unless .prom/.txt).
+        ``max_bytes``, ``backups``: a JSON-lines file is renamed ``path.1`` (``path.2``...) when it exceeds
+        ``max_bytes``, keeping at most ``backups`` old files.
+        """
+        if fmt is None:
+            fmt = "openmetrics" if os.path.splitext(path)[1] in (".prom", ".txt") else "jsonl"
+        if fmt not in ("openmetrics", "jsonl"):
+            raise ValueError('fmt must be "openmetrics" or "jsonl"')
+        self.path = path
+        self.interval = interval
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return "<Exporter({0}, {1})>".format(self.path, self.fmt)
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            src = "{0}.{1}".format(self.path, i)
+            if os.path.exists(src):
+                os.replace(src, "{0}.{1}".format(self.path, i + 1))
+        if self.backups > 0:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+
+    def flush(self):
+        """Writes the current metrics now"""
+        records = collect()
+        if self.fmt == "openmetrics":
+            with open(self.path + ".tmp", "w") as f:
+                f.write(to_openmetrics(records))
+            os.replace(self.path + ".tmp", self.path)
+            return
+        line = json.dumps({"time": time.time(), "instruments": records}) + "\n"
+        if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+            self._rotate()
+        with open(self.path, "a") as f:
+            f.write(line)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Cannot write metrics to {self.path}: {e}")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the thread and writes the metrics a last time"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
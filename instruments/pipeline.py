@@ -0,0 +1,224 @@
+# Streaming acquisition pipeline
+#
+# A pipeline is a chain of stages. Each stage is a generator function taking the stream of
+# items of the previous stage and yielding its own items. Threaded stages (the default) run
+# in their own worker thread and are connected by bounded queues: a slow stage (disk writer,
+# plot) blocks its producer when the queue is full instead of letting memory grow.
+#
+# Example (average 10 sweeps of a Zvk and save each average without stalling the VNA):
+#   p = pipeline.Pipeline(
+#       pipeline.source(zvk.get_data, count=1000),
+#       pipeline.average(10),
+#       pipeline.sink(pipeline.savez("sweeps/avg_{:04d}.npz")),
+#   )
+#   p.run()
+
+import queue
+import threading
+
+import numpy as np
+
+_END = object()  # end-of-stream marker passed through the queues
+
+
+class Stage(object):
+    def __init__(self, function, threaded=True, name=None):
+        """``function`` takes an iterable of items and returns an iterator of items.
+        A threaded stage runs in its own thread, otherwise it runs in the thread of the previous stage.
+        """
+        self.function = function
+        self.threaded = threaded
+        self.name = name or getattr(function, "__name__", "stage")
+
+    def __repr__(self):
+        return "<Stage({0})>".format(self.name)
+
+
+def _apply(item, func):
+    # items are arrays or tuples of arrays (e.g. (f, z) returned by Zvk.get_data)
+    if isinstance(item, tuple):
+        return tuple(func(np.asarray(x)) for x in item)
+    return func(np.asarray(item))
+
+
+def source(fetch, count=None, *args, **kwargs):
+    """Stage calling ``fetch(*args, **kwargs)`` ``count`` times (forever if None) and yielding the results.
+    Typical fetch functions: ``Zvk.get_data``, ``Fsva.get_trace``, ``Yoko750.get_binary``.
+    """
+
+    def acquire(_):
+        n = 0
+        while count is None or n < count:
+            yield fetch(*args, **kwargs)
+            n += 1
+
+    return Stage(acquire, name=getattr(fetch, "__name__", "source"))
+
+
+def transform(func, threaded=True):
+    """Stage applying ``func`` to every item (e.g. a fit)"""
+
+    def apply(items):
+        for item in items:
+            yield func(item)
+
+    return Stage(apply, threaded, name=getattr(func, "__name__", "transform"))
+
+
+def decimate(factor, threaded=False):
+    """Stage keeping one point out of ``factor`` in every array of an item"""
+    return transform(lambda item: _apply(item, lambda a: a[..., ::factor]), threaded)
+
+
+def average(n, threaded=False):
+    """Stage yielding the mean of every ``n`` successive items (e.g. sweeps)"""
+
+    def apply(items):
+        acc = None
+        k = 0
+        for item in items:
+            if acc is None:
+                acc = _apply(item, lambda a: a.astype(np.result_type(a, np.float64)))
+            elif isinstance(acc, tuple):
+                acc = tuple(a + b for a, b in zip(acc, item))
+            else:
+                acc = acc + item
+            k += 1
+            if k == n:
+                yield _apply(acc, lambda a: a / n)
+                acc = None
+                k = 0
+
+    return Stage(apply, threaded, name="average")
+
+
+def sink(func, threaded=True):
+    """Final stage calling ``func(item)`` on every item (write to disk, update a plot)"""
+
+    def consume(items):
+        for item in items:
+            func(item)
+        return
+        yield
+
+    return Stage(consume, threaded, name=getattr(func, "__name__", "sink"))
+
+
+def savez(pattern):
+    """Returns a function saving successive items to ``pattern.format(index)`` with ``numpy.savez``"""
+    counter = [0]
+
+    def save(item):
+        arrays = item if isinstance(item, tuple) else (item,)
+        np.savez(pattern.format(counter[0]), *arrays)
+        counter[0] += 1
+
+    return save
+
+
+class Pipeline(object):
+    def __init__(self, *stages, maxsize=4):
+        """``stages``: the source stage followed by transform and sink stages.
+        ``maxsize``: capacity (in items) of the queues between threaded stages.
+        """
+        if len(stages) == 0:
+            raise ValueError("A pipeline needs at least a source stage")
+        self.stages = stages
+        self.maxsize = maxsize
+        self.error = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def __repr__(self):
+        return "<Pipeline({0})>".format(" -> ".join(s.name for s in self.stages))
+
+    def _get(self, q, ended):
+        while True:
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            if item is _END:
+                ended.set()
+                return
+            yield item
+
+    def _put(self, q, item):
+        # blocks while the queue is full (backpressure), unless the pipeline is stopped
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run_segment(self, segment, q_in, q_out):
+        ended = threading.Event()  # input stream read up to its end
+        stream = self._get(q_in, ended) if q_in is not None else iter(())
+        for stage in segment:
+            stream = stage.function(stream)
+        try:
+            for item in stream:
+                if q_out is not None and not self._put(q_out, item):
+                    break
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+            self._stop.set()
+        finally:
+            if hasattr(stream, "close"):
+                stream.close()
+            if q_in is not None and not ended.is_set():
+                # stage ended before its input (consumer returned early): stop the upstream
+                # stages, which would otherwise block forever on the full queue
+                self._stop.set()
+            if q_out is not None:
+                self._put(q_out, _END)
+
+    def start(self):
+        """Starts one worker thread per threaded stage and returns immediately"""
+        segments = []
+        for stage in self.stages:
+            if stage.threaded or not segments:
+                segments.append([])
+            segments[-1].append(stage)
+        queues = [queue.Queue(self.maxsize) for _ in segments[1:]] + [None]
+        q_in = None
+        for segment, q_out in zip(segments, queues):
+            t = threading.Thread(
+                target=self._run_segment,
+                args=(segment, q_in, q_out),
+                name="pipeline-" + segment[0].name,
+                daemon=True,
+            )
+            self._threads.append(t)
+            q_in = q_out
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        """Stops all stages (the source stops after its current fetch)"""
+        self._stop.set()
+
+    def join(self, timeout=None):
+        """Waits for the end of the stream and raises the first error of any stage"""
+        for t in self._threads:
+            t.join(timeout)
+        if self.error is not None:
+            raise self.error
+
+    def running(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def run(self):
+        """Runs the pipeline until the source is exhausted"""
+        self.start()
+        try:
+            self.join()
+        except KeyboardInterrupt:
+            self.stop()
+            self.join()
+            raise
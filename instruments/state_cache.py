@@ -0,0 +1,60 @@
+# Client-side driver state persisted between sessions (warm restart)
+#
+# Instr.clean() saves the attributes a driver would otherwise rediscover at construction
+# (current channel, active traces, ranges...) to one JSON file per VISA resource. The next
+# construction restores them if the instrument identification matches, and the driver
+# confirms them with a single query before trusting them.
+
+import json
+import os
+import re
+import time
+
+STATE_DIR = os.environ.get(
+    "INSTRUMENTS_STATE_DIR", os.path.join(os.path.expanduser("~"), ".instruments", "state")
+)
+
+
+def _path(visa_name):
+    return os.path.join(STATE_DIR, re.sub(r"[^A-Za-z0-9]+", "_", visa_name).strip("_") + ".json")
+
+
+def _to_json(obj):
+    # numpy scalars (values parsed from the instrument) are stored as Python numbers
+    if hasattr(obj, "item"):
+        return obj.item()
+    raise TypeError("{0} is not serializable".format(type(obj).__name__))
+
+
+def save(visa_name, idn, state):
+    """Saves ``state`` (a JSON-serializable dictionary) for resource ``visa_name`` identified by ``idn``"""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    record = {"visa_name": visa_name, "idn": idn, "time": time.time(), "state": state}
+    path = _path(visa_name)
+    with open(path + ".tmp", "w") as f:
+        json.dump(record, f, default=_to_json)
+    os.replace(path + ".tmp", path)
+
+
+def load(visa_name, idn=None):
+    """Returns the state saved for ``visa_name``, or None if there is none, if it is unreadable,
+    or if ``idn`` is given and differs from the identification saved with it.
+    """
+    try:
+        with open(_path(visa_name)) as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if record.get("visa_name") != visa_name:
+        return None
+    if idn is not None and record.get("idn") != idn:
+        return None
+    return record["state"]
+
+
+def forget(visa_name):
+    """Deletes the state saved for ``visa_name`` (next construction does a full discovery)"""
+    try:
+        os.remove(_path(visa_name))
+    except OSError:
+        pass
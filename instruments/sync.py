@@ -0,0 +1,265 @@
+# Hardware-triggered acquisitions across instruments
+#
+# Instead of sequencing in software (set the source, sleep, trigger the VNA, poll the scope),
+# every instrument is configured to wait for a hardware trigger, armed, and a single master
+# produces the triggers (a software *TRG to a generator whose output is cabled to the
+# trigger inputs, or an external clock). After the run, every instrument that can report it
+# is asked how many triggers it actually received, and the counts are compared with the
+# expected number.
+#
+# Example (AnaPico stepping on *TRG, its trigger output cabled to the scope, VNA and SMU):
+#   s = sync.Synchronizer(
+#       {yoko: {"source": "EXT"}, znb: {}, k2400: {}, instek: {"cycles": 10}},
+#       master=anapico,
+#   )
+#   report = s.run(count=101, period=0.05)
+#   report["ok"]    # every instrument saw 101 triggers
+
+import time
+
+# adapters by driver class name (drivers are not imported here: they pull their own dependencies)
+_ADAPTERS = {}
+
+
+def _adapter(*class_names):
+    def register(cls):
+        for name in class_names:
+            _ADAPTERS[name] = cls
+        return cls
+
+    return register
+
+
+class Participant(object):
+    """Trigger configuration of one instrument. Subclasses implement the steps they support."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.count = None
+
+    @property
+    def name(self):
+        return getattr(self.driver, "visa_name", repr(self.driver))
+
+    def __repr__(self):
+        return "<{0}({1})>".format(type(self).__name__, self.name)
+
+    def configure(self, count):
+        """Sets the trigger source and the number of triggered acquisitions"""
+        self.count = count
+
+    def arm(self):
+        """Makes the instrument wait for its triggers"""
+
+    def fire(self):
+        """Produces one trigger (masters only)"""
+        raise NotImplementedError("{0} cannot be used as trigger master".format(type(self).__name__))
+
+    def finish(self):
+        """Ends the acquisition after the last trigger"""
+
+    def triggers(self):
+        """Number of triggers received, or None if the instrument cannot report it"""
+        return None
+
+
+@_adapter("Yoko750")
+class YokoTrigger(Participant):
+    def __init__(self, driver, source="EXT", mode="NORM"):
+        """Yoko750 acquiring one record per trigger on ``source``; records go to the history memory"""
+        super(YokoTrigger, self).__init__(driver)
+        self.source = source
+        self.mode = mode
+
+    def configure(self, count):
+        super(YokoTrigger, self).configure(count)
+        self.driver.trigger_source(self.source)
+        self.driver.trigger_mode(self.mode)
+        # records left by earlier acquisitions would be counted as triggers
+        self.driver.history_clear()
+
+    def arm(self):
+        self.driver.start()
+
+    def finish(self):
+        self.driver.stop()
+
+    def triggers(self):
+        return self.driver.history_records()
+
+
+@_adapter("Znb")
+class ZnbTrigger(Participant):
+    def __init__(self, driver, source="EXTernal"):
+        """Znb doing one sweep per trigger on ``source``, ``count`` sweeps per run"""
+        super(ZnbTrigger, self).__init__(driver)
+        self.source = source
+
+    def configure(self, count):
+        super(ZnbTrigger, self).configure(count)
+        self.driver.set_trigger_source(self.source)
+        self.driver.sweep_count = count
+
+    def arm(self):
+        self.driver.sweep_single()
+
+    def fire(self):
+        self.driver.send_trigger()
+
+    def triggers(self):
+        return self.driver.get_nb_sweeps_done()
+
+
+@_adapter("K2400")
+class K2400Trigger(Participant):
+    def __init__(self, driver, source="TLINk"):
+        """K2400 doing one source-measure point per trigger (trigger link), readings stored in its buffer"""
+        super(K2400Trigger, self).__init__(driver)
+        self.source = source
+
+    def configure(self, count):
+        super(K2400Trigger, self).configure(count)
+        self.driver.trigger_clear()
+        self.driver.write(":ARM:SOUR IMM;:ARM:COUN 1")
+        self.driver.write(":TRIG:SOUR {0};:TRIG:COUN {1}".format(self.source, count))
+        self.driver.data_buffer_clear()
+        self.driver.data_buffer_size(count)
+        self.driver.write(":TRAC:FEED:CONT NEXT")
+
+    def arm(self):
+        self.driver.initiate()
+
+    def fire(self):
+        self.driver.group_execute_trigger()
+
+    def finish(self):
+        self.driver.abort()
+
+    def triggers(self):
+        return int(self.driver.data_nb_points())
+
+
+@_adapter("AnaPico")
+class AnaPicoTrigger(Participant):
+    """AnaPico stepping (list or sweep mode) on *TRG; usually the master"""
+
+    def fire(self):
+        self.driver.trigger()
+
+
+@_adapter("Instek3032")
+class InstekBurst(Participant):
+    def __init__(self, driver, cycles=1, source="EXTernal"):
+        """Instek3032 emitting a burst of ``cycles`` periods per trigger on ``source`` (MANual to use it as master)"""
+        super(InstekBurst, self).__init__(driver)
+        self.cycles = cycles
+        self.source = source
+
+    def configure(self, count):
+        super(InstekBurst, self).configure(count)
+        self.driver.burst = True
+        self.driver.burst_cycles = self.cycles
+        self.driver.burst_source = self.source
+
+    def fire(self):
+        self.driver.trigger()
+
+
+class ExternalMaster(Participant):
+    def __init__(self, period=None):
+        """Triggers produced by external hardware (free-running clock...): fire() only waits ``period``"""
+        super(ExternalMaster, self).__init__(None)
+        self.period = period
+
+    @property
+    def name(self):
+        return "external"
+
+    def fire(self):
+        pass
+
+
+def participant(driver, **options):
+    """Adapter of ``driver`` (a Participant is returned unchanged)"""
+    if isinstance(driver, Participant):
+        return driver
+    for cls in type(driver).__mro__:
+        if cls.__name__ in _ADAPTERS:
+            return _ADAPTERS[cls.__name__](driver, **options)
+    raise TypeError("No trigger adapter for {0}".format(type(driver).__name__))
+
+
+class Synchronizer(object):
+    def __init__(self, followers, master=None):
+        """``followers``: ``{driver: options}`` (or a list of drivers / Participants) triggered in hardware.
+        ``master``: driver or Participant producing the triggers (default: external hardware).
+        """
+        if isinstance(followers, dict):
+            self.followers = [participant(d, **options) for d, options in followers.items()]
+        else:
+            self.followers = [participant(d) for d in followers]
+        self.master = ExternalMaster() if master is None else participant(master)
+
+    def __repr__(self):
+        return "<Synchronizer({0} -> {1})>".format(self.master.name, ", ".join(f.name for f in self.followers))
+
+    def configure(self, count):
+        for p in self.followers:
+            p.configure(count)
+        self.master.configure(count)
+
+    def arm(self, delay=0.0):
+        """Arms the followers, then waits ``delay`` seconds (instruments needing time to get ready)"""
+        for p in self.followers:
+            p.arm()
+        # no *OPC? here: armed instruments only complete the operation after their last trigger
+        time.sleep(delay)
+
+    def fire(self, count, period=0.0):
+        """Produces ``count`` triggers from the master, ``period`` seconds apart"""
+        t = time.perf_counter()
+        for i in range(count):
+            self.master.fire()
+            if period:
+                t += period
+                delay = t - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def finish(self):
+        for p in self.followers:
+            p.finish()
+
+    def verify(self, count):
+        """Compares the triggers received by every instrument with ``count``"""
+        received = {}
+        for p in self.followers:
+            try:
+                received[p.name] = p.triggers()
+            except Exception as e:
+                received[p.name] = "error: {0!r}".format(e)
+        missing = {
+            name: n for name, n in received.items() if n is not None and n != count
+        }
+        return {
+            "expected": count,
+            "received": received,
+            "mismatch": missing,
+            "unverified": [name for name, n in received.items() if n is None],
+            "ok": not missing,
+        }
+
+    def run(self, count, period=0.0, settle=0.0, arm_delay=0.1):
+        """Configures, arms, fires ``count`` triggers, waits ``settle`` seconds, ends and verifies. Returns the report."""
+        self.configure(count)
+        self.arm(arm_delay)
+        t0 = time.perf_counter()
+        if isinstance(self.master, ExternalMaster) and self.master.period:
+            time.sleep(count * self.master.period)
+        else:
+            self.fire(count, period)
+        time.sleep(settle)
+        self.finish()
+        report = self.verify(count)
+        report["duration"] = time.perf_counter() - t0
+        return report
@@ -0,0 +1,195 @@
+# Compact container for oscilloscope traces
+#
+# A Trace keeps the raw codes sent by the instrument (int16 for WORD transfers) with the
+# range, offset and divisor needed to scale them, instead of float64 values and time axis:
+# 2 bytes per point instead of 16. Scaled values (y) and the time axis (x) are computed when
+# first used and cached as evictable entries of the instrument's MemoryAccount; values()
+# and time() compute them in another dtype (e.g. float32) without caching.
+
+import numpy as np
+
+from instruments import memory
+
+
+class Trace(object):
+    __slots__ = (
+        "number",
+        "label",
+        "unit",
+        "gain",
+        "active",
+        "offset",
+        "bandwidth",
+        "invert",
+        "ac_coupled",
+        "yrange",
+        "divisor",
+        "N",
+        "srate",
+        "module",
+        "probe",
+        "averaging",
+        "series",
+        "codes",
+        "_x",
+        "_y",
+        "_evicted",
+        "_memory",
+    )
+
+    def __init__(self, number=0, memory_account=None):
+        self.number = number
+        self.label = "CH{0}".format(number)
+        self.unit = "V"
+        self.gain = 1.0
+        self.active = False
+        self.offset = 0
+        self.bandwidth = 0  # full bandwidth = 0
+        self.invert = False
+        self.ac_coupled = False
+        self.yrange = 0  # Volt/div
+        self.divisor = 24000.0  # codes per 10 divisions (WORD format)
+        self.N = 0
+        self.srate = 0
+        self.module = "unknown"
+        self.probe = 1
+        self.averaging = 1
+        self.series = ""
+        self.codes = None  # raw codes as transferred, None if the values were transferred as text
+        self._x = None  # explicit time axis, otherwise computed from N and srate
+        self._y = None  # cached or explicit values
+        self._evicted = False
+        self._memory = memory_account  # MemoryAccount of the instrument
+
+    def __repr__(self):
+        return "<Trace({0})>".format(self.metadata())
+
+    def __str__(self):
+        return self.label
+
+    def metadata(self):
+        """Returns the settings of the trace (every attribute but the data) as a dictionary"""
+        return {k: getattr(self, k) for k in self.__slots__ if not k.startswith("_") and k != "codes"}
+
+    def set_metadata(self, metadata):
+        for k, v in metadata.items():
+            if k in self.__slots__ and not k.startswith("_") and k != "codes":
+                setattr(self, k, v)
+
+    def _account(self, name, data, evict):
+        if self._memory is not None:
+            self._memory.add((self.label, name), memory.nbytes(data), evict)
+
+    def _touch(self, name):
+        if self._memory is not None:
+            self._memory.touch((self.label, name))
+
+    def _forget(self, name):
+        if self._memory is not None:
+            self._memory.remove((self.label, name))
+
+    def set_codes(self, codes, yrange=None, offset=None, divisor=None):
+        """Stores the raw ``codes`` of a binary transfer; values are ``yrange * codes * 10 / divisor + offset``"""
+        if yrange is not None:
+            self.yrange = yrange
+        if offset is not None:
+            self.offset = offset
+        if divisor is not None:
+            self.divisor = divisor
+        self.codes = codes
+        self.N = len(codes)
+        self._evicted = False
+        self._y = None
+        self._forget("y")
+        self._account("codes", codes, self._drop_codes)
+
+    @property
+    def scale(self):
+        """``(gain, offset)`` converting codes to values (as used by liveplot)"""
+        return self.yrange * 10.0 / self.divisor, self.offset
+
+    def values(self, dtype=np.float64, out=None):
+        """Scaled values computed from the codes in ``dtype`` (not cached).
+        ``out``: array of N points (e.g. a reused float32 buffer) in which the values are computed in place.
+        Without data, an empty array (``out[:0]`` if ``out`` is given).
+        """
+        if self.codes is None:
+            if self._y is None:
+                return np.array([], dtype=dtype) if out is None else out[:0]
+            if out is None:
+                return np.array(self._y, dtype=dtype)
+            out[...] = self._y
+            return out
+        gain, offset = self.scale
+        if out is None:
+            out = self.codes.astype(dtype)
+        else:
+            out[...] = self.codes
+        # in place, in the output dtype: no full-size float64 temporary
+        out *= out.dtype.type(gain)
+        out += out.dtype.type(offset)
+        return out
+
+    def time(self, dtype=np.float64):
+        """Time axis (s) in ``dtype`` (not cached)"""
+        if not self.N or not self.srate:
+            return np.array([], dtype=dtype)
+        return np.arange(self.N, dtype=dtype) / np.dtype(dtype).type(self.srate)
+
+    @property
+    def x(self):
+        """Time axis (s). Computed from ``N`` and ``srate`` when first used, cached within the memory budget"""
+        if self._x is None:
+            if not self.N or not self.srate:
+                return np.array([])
+            self._x = self.time()
+            self._account("x", self._x, self._drop_x)
+        else:
+            self._touch("x")
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        self._x = value
+        self._forget("x")
+
+    @property
+    def y(self):
+        """Values. Computed from the codes when first used, cached within the memory budget"""
+        if self._evicted:
+            print("WARNING: data of trace {0} was evicted by the memory budget, fetch it again.".format(self.label))
+            return np.array([])
+        y = self._y
+        if y is None:
+            if self.codes is None:
+                return np.array([])
+            self._touch("codes")
+            y = self._y = self.values()
+            self._account("y", y, self._drop_y)
+        else:
+            self._touch("y")
+        return y
+
+    @y.setter
+    def y(self, value):
+        # values transferred as text: no codes
+        self._forget("codes")
+        self.codes = None
+        self._y = value
+        self._evicted = False
+        self.N = len(value)
+        self._account("y", value, self._drop_y)
+
+    def _drop_x(self):
+        self._x = None
+
+    def _drop_y(self):
+        self._y = None
+        if self.codes is None:
+            self._evicted = True
+
+    def _drop_codes(self):
+        # values already computed stay available (as if transferred as text)
+        self.codes = None
+        if self._y is None:
+            self._evicted = True
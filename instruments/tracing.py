@@ -0,0 +1,166 @@
+# Timeline of driver calls and VISA transactions (Chrome trace-event format)
+#
+# While tracing is on, every public method of a driver and every VISA call made through
+# Instr._io() is recorded as a span with its thread, start time and duration. The file
+# written by stop() opens in chrome://tracing or https://ui.perfetto.dev and shows whether
+# instruments driven from different threads actually overlap or wait for each other
+# (e.g. behind a shared GPIB board).
+#
+# Example:
+#   tracing.start()
+#   ... measurement ...
+#   tracing.stop("timeline.json")
+#
+# When tracing is off, a traced method costs one extra function call and a test.
+
+import functools
+import json
+import os
+import threading
+import types
+from contextlib import contextmanager
+from time import perf_counter
+
+_recorder = None
+
+
+class Recorder(object):
+    def __init__(self, max_events=1000000):
+        """Collects trace events in memory; spans beyond ``max_events`` are dropped (and counted)"""
+        self.max_events = max_events
+        self.events = []
+        self.dropped = 0
+        self.t0 = perf_counter()
+        self.pid = os.getpid()
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, category, start, end, args=None):
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        thread = threading.current_thread()
+        tid = thread.ident
+        if tid not in self._threads:
+            with self._lock:
+                self._threads[tid] = thread.name
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self.t0) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": self.pid,
+            "tid": tid,
+        }
+        if args:
+            event["args"] = args
+        self.events.append(event)  # list.append is atomic: no lock on the hot path
+
+    def to_dict(self):
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+            for tid, name in self._threads.items()
+        ]
+        metadata.append(
+            {"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0, "args": {"name": "instruments"}}
+        )
+        return {
+            "traceEvents": metadata + list(self.events),
+            "displayTimeUnit": "ms",
+            "otherData": {"dropped_events": self.dropped},
+        }
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+
+def start(max_events=1000000):
+    """Starts recording (discarding any previous recording)"""
+    global _recorder
+    _recorder = Recorder(max_events)
+
+
+def stop(path=None):
+    """Stops recording, writes the trace to ``path`` if given and returns the Recorder"""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None and path is not None:
+        recorder.save(path)
+    return recorder
+
+
+def enabled():
+    return _recorder is not None
+
+
+@contextmanager
+def record(path, max_events=1000000):
+    """Context manager: traces the enclosed block and writes the trace to ``path``"""
+    start(max_events)
+    try:
+        yield
+    finally:
+        stop(path)
+
+
+@contextmanager
+def span(name, category="user", **args):
+    """Records the enclosed block as a span (e.g. one point of a sweep in a measurement script)"""
+    recorder = _recorder
+    if recorder is None:
+        yield
+        return
+    t0 = perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add(name, category, t0, perf_counter(), args)
+
+
+def traced(function, name=None, category="api"):
+    """Wraps a driver method so that its calls are recorded while tracing is on"""
+    name = name or function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        recorder = _recorder
+        if recorder is None:
+            return function(self, *args, **kwargs)
+        t0 = perf_counter()
+        try:
+            return function(self, *args, **kwargs)
+        finally:
+            recorder.add(name, category, t0, perf_counter(), {"instrument": getattr(self, "visa_name", None)})
+
+    wrapper.__traced__ = True
+    return wrapper
+
+
+def untraced(function):
+    """Decorator excluding a public method from ``trace_public_methods``"""
+    function.__traced__ = False
+    return function
+
+
+def trace_public_methods(cls):
+    """Wraps the public methods and properties defined in class ``cls`` with ``traced``"""
+    for key, value in list(vars(cls).items()):
+        if key.startswith("_"):
+            continue
+        name = "{0}.{1}".format(cls.__name__, key)
+        if isinstance(value, property):
+            setattr(
+                cls,
+                key,
+                property(
+                    traced(value.fget, name) if value.fget is not None else None,
+                    traced(value.fset, name + "=") if value.fset is not None else None,
+                    value.fdel,
+                    value.__doc__,
+                ),
+            )
+        elif isinstance(value, types.FunctionType) and not hasattr(value, "__traced__"):
+            setattr(cls, key, traced(value, name))
+    return cls
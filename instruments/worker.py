@@ -0,0 +1,217 @@
+# Drivers running in their own worker process
+#
+# Decoding large payloads (ASCII sweeps, int16 to volts scaling, complex interleaving) holds
+# the GIL: two instruments fetched from two threads of the same process are decoded one after
+# the other. RemoteDriver constructs the driver in a separate process and forwards method
+# calls and attribute accesses to it through a pipe. Large arrays in the results come back
+# through shared memory: the parent maps them without copy, and the shared memory is released
+# when the returned array is garbage collected.
+#
+# Example:
+#   yoko = worker.RemoteDriver(yoko750.Yoko750, "TCPIP::192.168.0.5::INSTR")
+#   znb = worker.RemoteDriver(znb.Znb, "TCPIP::192.168.0.6::INSTR")
+#   # fetches from two threads now decode in parallel
+#   ...
+#   yoko.close()
+#
+# Notes:
+#   - the worker owns the VISA session: do not also open the instrument in the parent;
+#   - GPIB bus arbitration (gpib_bus) is per process: instruments sharing a GPIB board
+#     should stay in the parent process.
+
+import importlib
+import inspect
+import multiprocessing
+import threading
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# arrays smaller than this (bytes) are sent through the pipe
+SHARED_MEMORY_THRESHOLD = 64 * 1024
+
+_CALLABLE = "<callable>"
+
+
+class _SharedArray(object):
+    """Pickled description of an array placed in shared memory by the worker"""
+
+    __slots__ = ("name", "shape", "dtype")
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    def __getstate__(self):
+        return (self.name, self.shape, self.dtype)
+
+    def __setstate__(self, state):
+        self.name, self.shape, self.dtype = state
+
+
+def _export(value):
+    # worker side: large arrays (also inside tuples, lists and dictionaries) to shared memory
+    if isinstance(value, np.ndarray) and value.nbytes >= SHARED_MEMORY_THRESHOLD and value.dtype != object:
+        shm = shared_memory.SharedMemory(create=True, size=value.nbytes)
+        np.ndarray(value.shape, value.dtype, buffer=shm.buf)[...] = value
+        description = _SharedArray(shm.name, value.shape, value.dtype.str)
+        shm.close()
+        # the parent unlinks the segment when it no longer uses it
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return description
+    if isinstance(value, tuple):
+        return tuple(_export(v) for v in value)
+    if isinstance(value, list):
+        return [_export(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _export(v) for k, v in value.items()}
+    return value
+
+
+def _release(shm):
+    shm.close()
+    shm.unlink()
+
+
+def _import(value):
+    # parent side: arrays mapped on the shared memory, released with the array
+    if isinstance(value, _SharedArray):
+        shm = shared_memory.SharedMemory(name=value.name)
+        array = np.ndarray(value.shape, np.dtype(value.dtype), buffer=shm.buf)
+        weakref.finalize(array, _release, shm)
+        return array
+    if isinstance(value, tuple):
+        return tuple(_import(v) for v in value)
+    if isinstance(value, list):
+        return [_import(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _import(v) for k, v in value.items()}
+    return value
+
+
+def _serve(conn, module, qualname, args, kwargs):
+    cls = importlib.import_module(module)
+    for name in qualname.split("."):
+        cls = getattr(cls, name)
+    try:
+        driver = cls(*args, **kwargs)
+    except Exception as e:
+        conn.send(("error", e))
+        return
+    conn.send(("ok", None))
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            request = ("close",)
+        kind = request[0]
+        try:
+            if kind == "close":
+                if hasattr(driver, "clean") and not getattr(driver, "_clean", True):
+                    driver.clean()
+                conn.send(("ok", None))
+                return
+            elif kind == "call":
+                _, name, call_args, call_kwargs = request
+                result = getattr(driver, name)(*call_args, **call_kwargs)
+                if inspect.isgenerator(result):
+                    # a generator cannot be pickled, and iterating it remotely would need one request per item
+                    result.close()
+                    raise TypeError("{0}() returns a generator, which cannot be called through a worker".format(name))
+            elif kind == "getattr":
+                value = getattr(driver, request[1])
+                result = _CALLABLE if callable(value) else value
+            elif kind == "setattr":
+                setattr(driver, request[1], request[2])
+                result = None
+            else:
+                raise ValueError("Unknown request {0!r}".format(kind))
+            reply = ("ok", _export(result))
+        except Exception as e:
+            reply = ("error", e)
+        try:
+            conn.send(reply)
+        except Exception as e:  # unpicklable result or exception
+            conn.send(("error", RuntimeError(repr(e))))
+
+
+class RemoteDriver(object):
+    def __init__(self, cls, *args, **kwargs):
+        """Constructs ``cls(*args, **kwargs)`` in a new worker process and forwards calls to it.
+        Method calls return the result of the driver method; reading or setting a (non-callable)
+        attribute or property reads or sets it in the worker. Generator methods (iter_binary...)
+        are not supported: calling them raises TypeError.
+        """
+        context = multiprocessing.get_context("spawn")  # no inherited VISA sessions or locks
+        parent, child = context.Pipe()
+        object.__setattr__(self, "_conn", parent)
+        object.__setattr__(self, "_lock", threading.Lock())
+        object.__setattr__(self, "_callables", set())
+        object.__setattr__(self, "_name", "{0}{1!r}".format(cls.__name__, args))
+        process = context.Process(
+            target=_serve,
+            args=(child, cls.__module__, cls.__qualname__, args, kwargs),
+            name="worker-" + cls.__name__,
+            daemon=True,
+        )
+        object.__setattr__(self, "_process", process)
+        process.start()
+        child.close()
+        self._reply()
+
+    def __repr__(self):
+        return "<RemoteDriver({0}, pid {1})>".format(self._name, self._process.pid)
+
+    def _reply(self):
+        try:
+            status, value = self._conn.recv()
+        except EOFError:
+            raise RuntimeError("Worker process of {0} exited".format(self._name)) from None
+        if status == "error":
+            raise value
+        return _import(value)
+
+    def _request(self, *request):
+        with self._lock:
+            if not self._process.is_alive():
+                raise RuntimeError("Worker process of {0} is not running".format(self._name))
+            self._conn.send(request)
+            return self._reply()
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if name not in self._callables:
+            value = self._request("getattr", name)
+            if not (isinstance(value, str) and value == _CALLABLE):
+                return value
+            self._callables.add(name)
+
+        def method(*args, **kwargs):
+            return self._request("call", name, args, kwargs)
+
+        method.__name__ = name
+        return method
+
+    def __setattr__(self, name, value):
+        self._request("setattr", name, value)
+
+    def close(self, timeout=10):
+        """Cleans the driver in the worker and stops the worker process"""
+        if self._process.is_alive():
+            try:
+                self._request("close")
+            except (EOFError, OSError):
+                pass
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
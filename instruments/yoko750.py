@@ -3,7 +3,10 @@
 # 2016-07, Collège de France
 
 from instruments import instr
+from instruments import igor
+from instruments import trace
 import pyvisa as visa
+import json
 import time
 import numpy as np
 import matplotlib.pyplot as plt
@@ -16,6 +19,11 @@ RETURN_NO_ERROR = None
 FORMAT_WORD = "16bit"
 FORMAT_BYTE = "8bit"
 FORMAT_ASCII = "text"
+# pyvisa datatype, numpy dtype and divisor (codes per 10 divisions) of the binary formats
+BINARY_FORMATS = {
+    FORMAT_WORD: ('h', np.int16, 24000.0),
+    FORMAT_BYTE: ('b', np.int8, 93.75),
+}
 SMALL_DELAY = 0.1
 # [1,2,3,4,5,6,7,8,9,10,11,12,13,14]
 
@@ -50,7 +58,11 @@ def INFO(arg):
 
 class Yoko750(instr.Instr):
     def __init__(
-        self, visa_name, visa_library='', installed_channels=[1, 2, 3, 4, 9, 10, 11, 12]
+        self,
+        visa_name,
+        visa_library='',
+        installed_channels=[1, 2, 3, 4, 9, 10, 11, 12],
+        warm_restart=True,
     ):
         super(Yoko750, self).__init__(visa_name, visa_library)
         self.visa_instr.timeout = (
@@ -142,35 +154,6 @@ class Yoko750(instr.Instr):
             1e9,
         ]  # Unit : Total Samples
 
-        class Trace(object):
-            def __init__(self):
-                self.number = 0
-                self.label = "CH{0}".format(self.number)
-                self.unit = "V"
-                self.gain = 1.0
-                self.active = False
-                self.offset = 0
-                self.bandwidth = 0  # full bandwidth = 0
-                self.invert = False
-                self.ac_coupled = False
-                self.x = np.array([])
-                self.y = np.array([])
-                self.yrange = 0  # Volt/div
-                self.N = 0
-                self.module = "unknown"
-                self.probe = 1
-                self.averaging = 1
-                self.series = ""
-
-            def __repr__(self):
-                return "<Trace({0})>".format(self.__dict__)
-
-            def __str__(self):
-                return self.label
-
-            def __del__(self):
-                pass
-
         self.errors_clear()
 
         self.calibration_auto = False
@@ -178,16 +161,55 @@ class Yoko750(instr.Instr):
 
         self._waveformat = 'TEXT'
 
-        self.traces = [Trace() for i in range(max(self.hardware_channels))]
-        for i in range(len(self.traces)):
-            self.traces[i].number = i + 1
-            self.traces[i].label = "CH{0}".format(self.traces[i].number)
+        # waveform settings read once per configuration change (see waveform_metadata()):
+        # "acquisition" for the settings common to all traces, trace number for each trace
+        self._metadata = {}
+        self._window = None  # (record, start, end) last sent with :WAV:REC, :WAV:STAR and :WAV:END
 
-        self.active_traces = []
-        self.get_trace_list()
+        def new_traces():
+            return [trace.Trace(i + 1, self.memory) for i in range(max(self.hardware_channels))]
 
+        self.traces = new_traces()
+        self.active_traces = []
         self.trace_current = None
-        self.current_trace()
+
+        # warm restart: active traces and trace metadata saved by the last clean(), confirmed by one query
+        if warm_restart and self.load_state(self.idn) and self._restored_state_is_valid():
+            INFO("Trace configuration restored from last session")
+        else:
+            self.traces = new_traces()
+            self.get_trace_list()
+            self.current_trace()
+
+    persistent_state = ("active_traces", "trace_current")
+
+    def get_persistent_state(self):
+        state = super(Yoko750, self).get_persistent_state()
+        state["traces"] = [
+            tr.metadata()
+            for tr in self.traces
+        ]
+        return state
+
+    def set_persistent_state(self, state):
+        state = dict(state)
+        for tr, meta in zip(self.traces, state.pop("traces", [])):
+            tr.set_metadata(meta)
+        super(Yoko750, self).set_persistent_state(state)
+
+    def _restored_state_is_valid(self):
+        """ Checks current trace and displayed channels against the restored state with one compound query
+        """
+        values = self.query(
+            ":WAV:TRAC?;"
+            + ";".join(":CHAN{0}:DISP?".format(i) for i in self.hardware_channels)
+        ).split(";")
+        displayed = [
+            i for i, v in zip(self.hardware_channels, values[1:]) if v == "1"
+        ]
+        return self._to_int(values[0]) == self.trace_current and sorted(
+            displayed
+        ) == sorted(self.active_traces)
 
     def clean(self):
         # self.write("COMMUNICATE:HEADER ON")
@@ -290,10 +312,17 @@ class Yoko750(instr.Instr):
         bit = 5  # CME bit
         return 2 ** bit & self._standard_event_register()
 
+    def _on_recovery(self):
+        # the recovered session may follow a device clear: formats and windows are sent again
+        self._waveformat = None
+        self.invalidate_metadata()
+
     def reset(self):
         """Collectively initializes the current settings of the following command groups. ACCumulate, ACQuire, CHANnel<x>, TIMebase, TRIGger
         """
         self.write("*RST")
+        self._waveformat = None
+        self.invalidate_metadata()
 
     def clear_status(self):
         """Clears the standard event register, extended event register, and error queue.
@@ -346,7 +375,7 @@ class Yoko750(instr.Instr):
         self.write(':IMAG:SEND?')
         termination = self.visa_instr.read_termination
         self.visa_instr.read_termination = None
-        bindata = self.visa_instr.read_raw()
+        bindata = self.read_raw()
         self.visa_instr.read_termination = termination
         data = io.BytesIO()
         with data as tmp:
@@ -381,6 +410,7 @@ class Yoko750(instr.Instr):
             return self.query_ascii_values(":ACQ:RLEN?")[0]
         elif value in self.possible_record_lengths:
             self.write(":ACQ:RLEN {0}".format(value))
+            self.invalidate_metadata()
             return RETURN_NO_ERROR
         else:
             ERR("Possible record lengths are {0}".format(self.possible_record_lengths))
@@ -396,9 +426,11 @@ class Yoko750(instr.Instr):
                 return False
         elif yes:
             self.write(":ACQ:CLOC EXT")
+            self.invalidate_metadata()
             return RETURN_NO_ERROR
         elif not yes:
             self.write(":ACQ:CLOC INT")
+            self.invalidate_metadata()
             return RETURN_NO_ERROR
         else:
             ERR(
@@ -431,7 +463,7 @@ class Yoko750(instr.Instr):
             self.acq_mode("NORM")
             return RETURN_NO_ERROR
         elif number == 0:
-            if self.trigger_mode() in ["SING", "NSIN", "LOG"]:
+            if self.trigger_mode()[:4] in self._NO_AVERAGING_TRIGGER_MODES:
                 ERR(
                     "Cannot use averaging when trigger is set to 'SINGle', 'NSINgle' or 'LOG'. Call trigger_mode() with argument 'AUTO', 'ALEVel' or 'NORMal' first."
                 )
@@ -439,9 +471,10 @@ class Yoko750(instr.Instr):
             else:
                 self.acq_mode("AVER")
                 self.write(":ACQ:AVER:COUN INF")
+                self.invalidate_metadata()
                 return RETURN_NO_ERROR
         elif number >= 2 and number <= 65536:
-            if self.trigger_mode() in ["SING", "NSIN", "LOG"]:
+            if self.trigger_mode()[:4] in self._NO_AVERAGING_TRIGGER_MODES:
                 ERR(
                     "Cannot use averaging when trigger is set to 'SINGle', 'NSINgle' or 'LOG'. Call trigger_mode() with argument 'AUTO', 'ALEVel' or 'NORMal' first."
                 )
@@ -456,6 +489,7 @@ class Yoko750(instr.Instr):
                         )
                     )
                 self.write(":ACQ:AVER:COUN {0}".format(rounded_number))
+                self.invalidate_metadata()
                 return RETURN_NO_ERROR
         else:
             ERR(
@@ -479,15 +513,19 @@ class Yoko750(instr.Instr):
             return self.query(":ACQ:MODE?")
         elif mode.upper().startswith("NORM"):
             self.write(":ACQ:MODE NORM")
+            self.invalidate_metadata()
             return RETURN_NO_ERROR
         elif mode.upper().startswith("AVER"):
             self.write(":ACQ:MODE AVER")
+            self.invalidate_metadata()
             return RETURN_NO_ERROR
         elif mode.upper().startswith("BAV"):
             self.write(":ACQ:MODE BAV")
+            self.invalidate_metadata()
             return RETURN_NO_ERROR
         elif mode.upper().startswith("ENV"):
             self.write(":ACQ:MODE ENV")
+            self.invalidate_metadata()
             return RETURN_NO_ERROR
         else:
             ERR(
@@ -512,6 +550,7 @@ class Yoko750(instr.Instr):
             return self.query_ascii_values(":TIM:SRAT?")[0]
         elif value in self.possible_timebases:
             self.write(":TIM:SRAT {0}".format(value))
+            self.invalidate_metadata()
             return RETURN_NO_ERROR
         else:
             ERR("Possible sample rate values are {0}".format(self.possible_timebases))
@@ -527,9 +566,11 @@ class Yoko750(instr.Instr):
                 return False
         elif yes:
             self.write(":TIM:SOUR INT")
+            self.invalidate_metadata()
             return RETURN_NO_ERROR
         elif not yes:
             self.write(":TIM:SOUR EXT")
+            self.invalidate_metadata()
             return RETURN_NO_ERROR
         else:
             ERR(
@@ -545,6 +586,7 @@ class Yoko750(instr.Instr):
             return self.query_ascii_values(":TIM:TDIV?")[0]
         elif value >= 500e-9 and value <= 1800:
             self.write(":TIM:TDIV {0}".format(value))
+            self.invalidate_metadata()
             return RETURN_NO_ERROR
         else:
             ERR("Possible time per division is from 500e-9 to 1800.")
@@ -574,6 +616,7 @@ class Yoko750(instr.Instr):
             return self.query_ascii_values(":CHAN{0}:VDIV?".format(tr))[0]
         elif value >= 0.1e-3 and value <= 200:
             self.write(":CHAN{0}:VDIV {1}".format(tr, value))
+            self.invalidate_metadata(tr)
             return RETURN_NO_ERROR
         else:
             ERR("Possible volt per division from 0.1e-3 to 200")
@@ -606,28 +649,23 @@ class Yoko750(instr.Instr):
 
     @waveformat.setter
     def waveformat(self, formattype):
-        if (
-            formattype.upper() == FORMAT_ASCII.upper()
-            and self._waveformat != FORMAT_ASCII
-        ):
-            self.write(':WAV:FORM ASC')
-            self._waveformat == FORMAT_ASCII
-        elif (
-            formattype.upper() == FORMAT_BYTE.upper()
-            and self._waveformat != FORMAT_BYTE
-        ):
-            self.write(':WAV:FORM BYTE')
-            assert self.query(":WAV:BITS?") == '8'
-            self.write(":WAV:BYTE LSBFIRST")
-            self._waveformat == FORMAT_BYTE
-        elif (
-            formattype.upper() == FORMAT_WORD.upper()
-            and self._waveformat != FORMAT_WORD
-        ):
-            self.write(':WAV:FORM WORD')
-            assert self.query(":WAV:BITS?") == '16'
-            self.write(":WAV:BYTE LSBFIRST")
-            self._waveformat == FORMAT_WORD
+        # the format is only sent when it changes (self._waveformat is the last format set)
+        if formattype.upper() == FORMAT_ASCII.upper():
+            if self._waveformat != FORMAT_ASCII:
+                self.write(':WAV:FORM ASC')
+                self._waveformat = FORMAT_ASCII
+        elif formattype.upper() == FORMAT_BYTE.upper():
+            if self._waveformat != FORMAT_BYTE:
+                self.write(':WAV:FORM BYTE')
+                assert self.query(":WAV:BITS?") == '8'
+                self.write(":WAV:BYTE LSBFIRST")
+                self._waveformat = FORMAT_BYTE
+        elif formattype.upper() == FORMAT_WORD.upper():
+            if self._waveformat != FORMAT_WORD:
+                self.write(':WAV:FORM WORD')
+                assert self.query(":WAV:BITS?") == '16'
+                self.write(":WAV:BYTE LSBFIRST")
+                self._waveformat = FORMAT_WORD
         else:
             ERR(
                 f"Parameter must be '{FORMAT_ASCII}' (ASCII), '{FORMAT_BYTE}' (binary 8 bit) or '{FORMAT_WORD}' (binary 16 bit, LSB)"
@@ -935,6 +973,305 @@ class Yoko750(instr.Instr):
         """
         return self.query_ascii_values(':WAV:TRAC?')[0]
 
+    def get_metadata(self):
+        """ Returns the acquisition settings (timebase, record length, and V/div and coupling of each active trace) as a dictionary, using a single compound query.
+        """
+        command = ":TIM:SRAT?;:ACQ:RLEN?"
+        for tr in self.active_traces:
+            command += ";:CHAN{0}:VDIV?;:CHAN{0}:COUP?".format(tr)
+        values = self.query(command).split(";")
+        meta = {
+            "timebase": self._to_float(values[0]),
+            "record_length": self._to_float(values[1]),
+            "channels": {},
+        }
+        for i, tr in enumerate(self.active_traces):
+            meta["channels"][tr] = {
+                "volt_per_div": self._to_float(values[2 + 2 * i]),
+                "coupling": values[3 + 2 * i],
+            }
+        return meta
+
+    _TRIGGER_MODES = ("AUTO", "ALEV", "NORM", "SING", "NSIN", "REP")
+    # trigger modes (first 4 letters) in which averaging is not possible
+    _NO_AVERAGING_TRIGGER_MODES = ("SING", "NSIN", "LOG")
+    _TRIGGER_SOURCES = ("EXT", "LINE", "TIME", "PODA", "PODB")
+
+    def configure(self, **settings):
+        """ Applies acquisition settings at once: all are validated locally, sent in one compound message and
+        checked with one compound query. Nothing is sent if a setting is invalid.
+        Settings (all optional):
+        * ``timebase`` (sample rate in Hz, in ``possible_timebases``), ``record_length`` (in ``possible_record_lengths``)
+        * ``traces``: list of the displayed traces (the others are turned off)
+        * ``volt_per_div``, ``ac_coupled``, ``bandwidth`` (Hz, 0 for full): one value for all displayed traces,
+          or a dictionary ``{trace: value}``
+        * ``trigger_source`` (trace number, 'EXT', 'LINE'...), ``trigger_mode`` ('AUTO', 'ALEV', 'NORM', 'SING', 'NSIN', 'REP'),
+          ``trigger_level`` (V), ``trigger_slope_down`` (bool), ``trigger_position`` (0 to 100 %)
+        * ``averaging``: 1 for none, 0 for infinite, 2 to 65536 (rounded to the lower power of 2), not in
+          'SING', 'NSIN' or 'LOG' trigger mode (the one given, otherwise the current one)
+        Returns None when the instrument reports the requested settings, otherwise a dictionary
+        ``{command: (requested, actual)}`` of the differences (e.g. bandwidth rounded by the instrument).
+        """
+        items = []  # (command, query, expected value)
+        errors = []
+        s = dict(settings)
+
+        def check(condition, message):
+            if not condition:
+                errors.append(message)
+            return condition
+
+        if "timebase" in s:
+            value = s.pop("timebase")
+            if check(value in self.possible_timebases, "timebase must be in {0}".format(self.possible_timebases)):
+                items.append((":TIM:SRAT {0}".format(value), ":TIM:SRAT?", None))
+        if "record_length" in s:
+            value = s.pop("record_length")
+            if check(
+                value in self.possible_record_lengths,
+                "record_length must be in {0}".format(self.possible_record_lengths),
+            ):
+                items.append((":ACQ:RLEN {0}".format(value), ":ACQ:RLEN?", None))
+
+        displayed = self.active_traces
+        if "traces" in s:
+            displayed = list(s.pop("traces"))
+            if check(
+                all(t in self.hardware_channels for t in displayed),
+                "traces must be in {0}".format(self.hardware_channels),
+            ):
+                for t in self.hardware_channels:
+                    on = t in displayed
+                    items.append((":CHAN{0}:DISP {1}".format(t, "ON" if on else "OFF"), ":CHAN{0}:DISP?".format(t), "1" if on else "0"))
+
+        def per_trace(name, valid, command, message):
+            if name not in s:
+                return
+            value = s.pop(name)
+            values = value if isinstance(value, dict) else {t: value for t in displayed}
+            for t, v in values.items():
+                if check(t in self.hardware_channels, "{0}: trace {1} is not a hardware channel".format(name, t)) and check(
+                    valid(v), "{0} of trace {1}: {2}".format(name, t, message)
+                ):
+                    items.append(command(t, v))
+
+        per_trace(
+            "volt_per_div",
+            lambda v: 0.1e-3 <= v <= 200,
+            lambda t, v: (":CHAN{0}:VDIV {1}".format(t, v), ":CHAN{0}:VDIV?".format(t), None),
+            "possible volt per division from 0.1e-3 to 200",
+        )
+        per_trace(
+            "ac_coupled",
+            lambda v: isinstance(v, bool),
+            lambda t, v: (":CHAN{0}:COUP {1}".format(t, "AC" if v else "DC"), ":CHAN{0}:COUP?".format(t), "AC" if v else "DC"),
+            "must be True or False",
+        )
+        per_trace(
+            "bandwidth",
+            lambda v: v == 0 or isinstance(v, float),
+            lambda t, v: (
+                ":CHAN{0}:BWID {1}".format(t, "FULL" if v == 0 else v),
+                ":CHAN{0}:BWID?".format(t),
+                "FULL" if v == 0 else None,
+            ),
+            "must be 0 (for FULL) or a frequency as a float value",
+        )
+
+        if "trigger_source" in s:
+            source = s.pop("trigger_source")
+            if isinstance(source, str):
+                source = "EXT" if source.upper().startswith("EXT") else source.upper()[:4]
+                if check(
+                    source in self._TRIGGER_SOURCES,
+                    "trigger_source must be a hardware channel or one of {0}".format(self._TRIGGER_SOURCES),
+                ):
+                    items.append((":TRIG:SIMP:SOUR {0}".format(source), ":TRIG:SIMP:SOUR?", source))
+            elif check(
+                source in self.hardware_channels,
+                "trigger_source must be a hardware channel or one of {0}".format(self._TRIGGER_SOURCES),
+            ):
+                items.append((":TRIG:SIMP:SOUR {0}".format(source), ":TRIG:SIMP:SOUR?", str(source)))
+        trigger_mode = None
+        if "trigger_mode" in s:
+            trigger_mode = str(s.pop("trigger_mode")).upper()[:4]
+            if check(trigger_mode in self._TRIGGER_MODES, "trigger_mode must be one of {0}".format(self._TRIGGER_MODES)):
+                items.append((":TRIG:MODE {0}".format(trigger_mode), ":TRIG:MODE?", trigger_mode))
+        if "trigger_level" in s:
+            items.append((":TRIG:SIMP:LEV {0}".format(s.pop("trigger_level")), ":TRIG:SIMP:LEV?", None))
+        if "trigger_slope_down" in s:
+            slope = "FALL" if s.pop("trigger_slope_down") else "RISE"
+            items.append((":TRIG:SIMP:SLOP {0}".format(slope), ":TRIG:SIMP:SLOP?", slope))
+        if "trigger_position" in s:
+            position = s.pop("trigger_position")
+            if check(0.0 <= position <= 100.0, "trigger_position must be between 0 and 100 (in %)."):
+                items.append((":TRIG:POS {0:.3f}".format(position), ":TRIG:POS?", None))
+
+        if "averaging" in s:
+            number = s.pop("averaging")
+            if number == 1:
+                items.append((":ACQ:MODE NORM", ":ACQ:MODE?", "NORM"))
+            elif check(
+                number == 0 or 2 <= number <= 65536,
+                "averaging must be 1 for no averaging, 0 for infinity, or 2 to 65536",
+            ) and check(
+                (trigger_mode or self.trigger_mode()[:4]) not in self._NO_AVERAGING_TRIGGER_MODES,
+                "averaging cannot be used with trigger mode 'SINGle', 'NSINgle' or 'LOG'",
+            ):
+                if number == 0:
+                    count = "INF"
+                else:
+                    count = 2 ** int(np.log2(number))
+                    if count != number:
+                        WARN("Number of averages requested ({0}) rounded to the lower power of 2: {1}".format(number, count))
+                items.append((":ACQ:MODE AVER", ":ACQ:MODE?", "AVER"))
+                items.append((":ACQ:AVER:COUN {0}".format(count), ":ACQ:AVER:COUN?", None if count != "INF" else "INF"))
+
+        check(not s, "unknown settings: {0}".format(sorted(s)))
+        if errors:
+            for e in errors:
+                ERR(e)
+            return RETURN_ERROR
+        if not items:
+            return RETURN_NO_ERROR
+
+        self.write(";".join(command for command, _, _ in items))
+        self.invalidate_metadata()
+        if "traces" in settings:
+            self.active_traces = [t for t in self.hardware_channels if t in displayed]
+            for t in self.hardware_channels:
+                self.traces[t - 1].active = t in displayed
+
+        values = self.query(";".join(query for _, query, _ in items)).split(";")
+        differences = {}
+        for (command, _, expected), value in zip(items, values):
+            requested = command.split(" ", 1)[1]
+            value = value.strip()
+            if expected is None:
+                same = self._to_float(value) is not None and np.isclose(self._to_float(value), float(requested), rtol=1e-6)
+            else:
+                same = value.upper().startswith(expected.upper())
+            if not same:
+                differences[command.split(" ", 1)[0]] = (requested, value)
+        if len(values) != len(items):
+            differences["verification"] = ("{0} values".format(len(items)), "{0} values".format(len(values)))
+        if differences:
+            WARN("Settings differ from the requested ones: {0}".format(differences))
+            return differences
+        return RETURN_NO_ERROR
+
+    # (trace attribute, query) of the waveform settings. :WAV: queries apply to the current trace
+    _ACQUISITION_QUERIES = (
+        ("N", ":WAV:LENG?"),
+        ("srate", ":WAV:SRAT?"),
+        ("acq_mode", ":ACQ:MODE?"),
+        ("averaging", ":ACQ:AVER:COUN?"),
+    )
+    _TRACE_QUERIES = (
+        ("yrange", ":WAV:RANG?"),
+        ("offset", ":WAV:OFFS?"),
+        ("module", ":WAV:MOD?"),
+        ("bandwidth", ":CHAN{0}:BWID?"),
+        ("invert", ":CHAN{0}:INV?"),
+        ("ac_coupled", ":CHAN{0}:COUP?"),
+        ("probe", ":CHAN{0}:PROB?"),
+    )
+
+    def invalidate_metadata(self, numtrace=None):
+        """ Forgets the cached waveform settings of trace ``numtrace`` (all settings for None).
+        Called by the setters of this class; call it after changing settings on the front panel.
+        """
+        if numtrace is None:
+            self._metadata.clear()
+            self._window = None
+        else:
+            self._metadata.pop(numtrace, None)
+
+    def waveform_metadata(self, numtrace):
+        """ Returns the settings needed to scale the waveform of trace ``numtrace`` (length, sample rate,
+        range, offset, bandwidth, coupling, probe, averaging...) as a dictionary.
+        Settings are read once with a single compound query and cached until a setter changes them.
+        """
+        self._read_metadata([numtrace])
+        meta = dict(self._metadata["acquisition"])
+        meta.update(self._metadata[numtrace])
+        return meta
+
+    def _read_metadata(self, numtraces):
+        # settings not cached yet of all ``numtraces``, in one compound query (switching :WAV:TRAC if needed)
+        names = []
+        commands = []
+        if "acquisition" not in self._metadata:
+            for name, query in self._ACQUISITION_QUERIES:
+                names.append(("acquisition", name))
+                commands.append(query)
+        current = self.trace_current
+        for tr in numtraces:
+            if tr in self._metadata:
+                continue
+            if tr != current:
+                commands.append(":WAV:TRAC {0}".format(tr))
+                current = tr
+            for name, query in self._TRACE_QUERIES:
+                names.append((tr, name))
+                commands.append(query.format(tr))
+        if not names:
+            return
+        values = self.query(";".join(commands)).split(";")
+        self.trace_current = current
+        if len(values) != len(names):
+            raise ValueError(
+                "Expected {0} values from '{1}', got {2}".format(len(names), ";".join(commands), values)
+            )
+        parsed = {}
+        for (key, name), value in zip(names, values):
+            parsed.setdefault(key, {})[name] = value.strip()
+        for key, values in parsed.items():
+            if key == "acquisition":
+                self._metadata[key] = self._parse_acquisition(values)
+            else:
+                self._metadata[key] = self._parse_trace(values)
+
+    def _parse_acquisition(self, values):
+        mode = values.pop("acq_mode").upper()
+        count = values["averaging"].upper()
+        if mode.startswith("NORM"):
+            averaging = 1
+        elif mode.startswith("AVER"):
+            averaging = 0 if count.startswith("INF") else self._to_int(count)
+        else:
+            averaging = None  # box averaging and envelope modes
+        return {
+            "N": self._to_int(values["N"]),
+            "srate": self._to_float(values["srate"]),
+            "averaging": averaging,
+        }
+
+    def _parse_trace(self, values):
+        return {
+            "yrange": self._to_float(values["yrange"]),
+            "offset": self._to_float(values["offset"]),
+            "module": values["module"],
+            "bandwidth": 0 if values["bandwidth"].upper() == "FULL" else self._to_float(values["bandwidth"]),
+            "invert": values["invert"] == "1",
+            "ac_coupled": values["ac_coupled"].upper() == "AC",
+            "probe": self._to_float(values["probe"]),
+        }
+
+    def _apply_metadata(self, numtrace, meta):
+        tr = self.traces[numtrace - 1]
+        for name, value in meta.items():
+            setattr(tr, name, value)
+        tr.x = None  # recomputed from N and srate when used
+
+    def _set_window(self, start, end, record=0):
+        """ Selects the history record and the points sent by :WAV:SEND?, in one write and only if they changed """
+        window = (record, start, end)
+        if window != self._window:
+            self._window = None
+            self.write(":WAV:REC {0};:WAV:STAR {1};:WAV:END {2}".format(record, start, end))
+            self._window = window
+
     # def record_length(self,value=None):
     #   if value is None:
     #       return self.query_ascii_values(":WAV:LENG?")[0]
@@ -966,27 +1303,12 @@ class Yoko750(instr.Instr):
         else:
             ERR("Trace {0} not enabled, cannot read data.".format(tracenum))
             return RETURN_ERROR
-        N = self.query_ascii_values(":WAV:LENG?")[0]
-        self.write(":WAV:END {0}".format(N + 1))
-        self.traces[trace_to_get - 1].N = N
+        meta = self.waveform_metadata(trace_to_get)
+        N = meta["N"]
+        self._set_window(0, N + 1)
         data = self.query_ascii_values(":WAV:SEND?")
+        self._apply_metadata(trace_to_get, meta)
         self.traces[trace_to_get - 1].y = np.array(data)
-        rang = self.query_ascii_values(":WAV:RANG?")[0]
-        offs = self.query_ascii_values(":WAV:OFFS?")[0]
-        self.traces[trace_to_get - 1].yrange = rang
-        self.traces[trace_to_get - 1].offset = offs
-        self.traces[trace_to_get - 1].bandwidth = self.bandwidth(trace_to_get)
-        self.traces[trace_to_get - 1].invert = self.invert(trace_to_get)
-        self.traces[trace_to_get - 1].ac_coupled = self.ac_coupled(trace_to_get)
-        self.traces[trace_to_get - 1].module = self.query(":WAV:MOD?")
-        self.traces[trace_to_get - 1].srate = float(self.query(":WAV:SRAT?"))
-        self.traces[trace_to_get - 1].x = (
-            np.arange(N) / self.traces[trace_to_get - 1].srate
-        )
-        self.traces[trace_to_get - 1].probe = self.query_ascii_values(
-            ":CHAN{0}:PROB?".format(trace_to_get)
-        )[0]
-        self.traces[trace_to_get - 1].averaging = self.averaging()
         return np.array(data)
 
     @staticmethod
@@ -1009,65 +1331,434 @@ class Yoko750(instr.Instr):
             out = None
         return out
 
-    def get_binary(self, tracenum=None):
+    def _binary_format(self, fmt):
+        if fmt not in BINARY_FORMATS:
+            raise ValueError(
+                f"Binary format must be '{FORMAT_BYTE}' (8 bit) or '{FORMAT_WORD}' (16 bit), not {fmt!r}"
+            )
+        self.waveformat = fmt
+        return BINARY_FORMATS[fmt]
+
+    def get_binary(self, tracenum=None, fmt=FORMAT_WORD, record=0, raw=False, dtype=np.float64, out=None):
         """ Returns the data acquired in trace number given in argument (default: current trace) using binary transfer
+        ``fmt``: ``'16bit'`` (WORD) or ``'8bit'`` (BYTE, half the bytes to transfer, about 94 codes over the 10 divisions instead of 24000)
+        ``record``: history record (0 for the last acquisition, -1 for the previous one...)
+        ``raw``: returns the codes without scaling; volts are ``codes * gain + offset`` with ``(gain, offset) = self.traces[n - 1].scale``
+        ``dtype``: dtype of the values (``np.float32`` halves the memory), ``out``: buffer of N points to compute them in place
+        In all cases the trace keeps only the codes: ``self.traces[n - 1].y`` is scaled when first used.
         """
-        self.waveformat = FORMAT_WORD
+        datatype, code_dtype, divis = self._binary_format(fmt)
 
         if tracenum is None:
             trace_to_get = int(self.trace_current)
         elif tracenum in self.active_traces:
             trace_to_get = int(tracenum)
-            self.current_trace(trace_to_get)
+            if trace_to_get != self.trace_current:
+                self.current_trace(trace_to_get)
         else:
             ERR("Trace {0} not enabled, cannot read data.".format(tracenum))
             return RETURN_ERROR
 
-        self.write(":WAV:REC 0")
-
-        tmp = self.query(":WAV:LENG?")
-        N = self._to_int(tmp)
-
-        divis = 24000.0
-
-        tmp = self.query(":WAV:RANG?")
-        rang = self._to_float(tmp)
-
-        tmp = self.query(":WAV:OFFS?")
-        offs = self._to_float(tmp)
+        # settings are cached: repeated fetches with the same configuration only transfer the data
+        meta = self.waveform_metadata(trace_to_get)
+        N = meta["N"]
+        rang = meta["yrange"]
+        offs = meta["offset"]
+        self._apply_metadata(trace_to_get, meta)
+        self._set_window(0, N - 1, record)
+        # function query_binary_values() from pyvisa module with parameter header_fmt='ieee' removes the IEEE header #<id><data_length><data>
+        # container=np.array: the codes are decoded directly into an array, without an intermediate list
+        dataraw = self.query_binary_values(
+            ":WAV:SEND?",
+            header_fmt='ieee',
+            datatype=datatype,
+            is_big_endian=False,
+            container=np.array,
+            delay=None,
+        )  # , expect_termination=False)) # datatype 'h' is for short = 2 bytes, 'b' for signed char
+        # the trace keeps the int16 (int8) codes, values are scaled when used
+        self.traces[trace_to_get - 1].set_codes(dataraw, rang, offs, divis)
+        if raw:
+            return dataraw
+        return self.traces[trace_to_get - 1].values(dtype, out)
+
+    def get_binary_all(self, traces=None, raw=False, fmt=FORMAT_WORD, record=0, dtype=np.float64):
+        """ Returns the data of all active traces (or of the list ``traces``) using binary transfer, in one pass:
+        settings of all traces in one compound query (cached, see ``waveform_metadata``), then one
+        trace switch + transfer per trace, written directly in the output array.
+        ``fmt``: ``'16bit'`` or ``'8bit'`` transfer, ``record``: history record (see ``get_binary``).
+        Returns ``(data, scales)``: ``data`` is a ``(channels, N)`` array, in volts (in ``dtype``), or the int16 (int8) codes if ``raw``;
+        ``scales`` is a ``(channels, 2)`` array of ``(gain, offset)`` with volts = ``codes * gain + offset``.
+        The time axis, common to all traces, is ``self.traces[n - 1].x``.
+        """
+        if traces is None:
+            traces = list(self.active_traces)
+        elif not isinstance(traces, list) or not all(t in self.active_traces for t in traces):
+            ERR(
+                "``traces`` argument must be None for all active traces or a list of active traces numbers (in {0}).".format(
+                    self.active_traces
+                )
+            )
+            return RETURN_ERROR
+        if not traces:
+            WARN("No active trace")
+            return RETURN_ERROR
 
-        self.traces[trace_to_get - 1].yrange = rang
-        self.traces[trace_to_get - 1].offset = offs
-        self.traces[trace_to_get - 1].bandwidth = self.bandwidth(trace_to_get)
-        self.traces[trace_to_get - 1].invert = self.invert(trace_to_get)
-        self.traces[trace_to_get - 1].ac_coupled = self.ac_coupled(trace_to_get)
-        self.traces[trace_to_get - 1].module = self.query(":WAV:MOD?")
-        self.traces[trace_to_get - 1].srate = self._to_float(self.query(":WAV:SRAT?"))
-        self.traces[trace_to_get - 1].x = (
-            np.arange(N) / self.traces[trace_to_get - 1].srate
-        )
-        self.traces[trace_to_get - 1].probe = self._to_int(
-            self.query(":CHAN{0}:PROB?".format(trace_to_get))
-        )
-        self.traces[trace_to_get - 1].averaging = self.averaging()
+        datatype, code_dtype, divis = self._binary_format(fmt)
+        # settings of all traces, read at once and cached
+        self._read_metadata(traces)
+        N = self._metadata["acquisition"]["N"]
+        self._set_window(0, N - 1, record)
+
+        codes = np.empty((len(traces), N), dtype=code_dtype)
+        scales = np.empty((len(traces), 2))
+        for i, tr in enumerate(traces):
+            # trace switch and transfer in one message
+            command = ":WAV:SEND?" if tr == self.trace_current else ":WAV:TRAC {0};:WAV:SEND?".format(tr)
+            codes[i] = self.query_binary_values(
+                command,
+                header_fmt='ieee',
+                datatype=datatype,
+                is_big_endian=False,
+                container=np.array,
+                delay=None,
+            )
+            self.trace_current = tr
+            meta = dict(self._metadata["acquisition"])
+            meta.update(self._metadata[tr])
+            self._apply_metadata(tr, meta)
+            self.traces[tr - 1].set_codes(codes[i], meta["yrange"], meta["offset"], divis)
+            scales[i] = self.traces[tr - 1].scale
+
+        if raw:
+            return codes, scales
+        data = codes.astype(dtype)
+        data *= scales[:, 0:1].astype(dtype)
+        data += scales[:, 1:2].astype(dtype)
+        return data, scales
+
+    def preview(self, tracenum=None, points=10000, average=4, segments=20, fmt=FORMAT_BYTE, record=0):
+        """ Returns a coarse preview ``(t, y)`` of trace ``tracenum`` (default: current trace) of about ``points`` points,
+        to decide quickly whether a capture is worth downloading.
+        ``segments`` windows evenly spaced over the record are transferred (:WAV:STAR/:WAV:END, one message each),
+        and each preview point is the average of ``average`` consecutive samples. ``t`` is the time (s) of each point.
+        Settings come from the same cache as ``get_binary``: the full download costs only its transfer.
+        ``fmt``: transfer format, 8 bit by default (averaging recovers part of the resolution).
+        """
+        datatype, code_dtype, divis = self._binary_format(fmt)
+        if tracenum is None:
+            trace_to_get = int(self.trace_current)
+        elif tracenum in self.active_traces:
+            trace_to_get = int(tracenum)
+            if trace_to_get != self.trace_current:
+                self.current_trace(trace_to_get)
+        else:
+            ERR("Trace {0} not enabled, cannot read data.".format(tracenum))
+            return RETURN_ERROR
 
-        self.traces[trace_to_get - 1].N = N
-        self.write(":WAV:STAR 0")
-        self.write(":WAV:END {0}".format(N - 1))
-        # function query_binary_values() from pyvisa module with parameter header_fmt='ieee' removes the IEEE header #<id><data_length><data>
-        dataraw = np.array(
-            self.visa_instr.query_binary_values(
-                ":WAV:SEND?",
+        meta = self.waveform_metadata(trace_to_get)
+        N = meta["N"]
+        gain = meta["yrange"] * 10.0 / divis
+        if points * average >= N:
+            # short record: all of it, averaged down to ``points``
+            average = max(1, N // points)
+            starts, length = [0], N
+        else:
+            length = max(1, points // segments) * average
+            starts = np.linspace(0, N - length, segments).astype(int)
+
+        t = []
+        y = []
+        for start in starts:
+            end = start + length - 1
+            # the message changes the window: unknown until the transfer completed
+            self._window = None
+            codes = self.query_binary_values(
+                ":WAV:REC {0};:WAV:STAR {1};:WAV:END {2};:WAV:SEND?".format(record, start, end),
                 header_fmt='ieee',
-                datatype='h',
+                datatype=datatype,
                 is_big_endian=False,
+                container=np.array,
                 delay=None,
             )
-        )  # , expect_termination=False)) # datatype 'h' is for short = 2 bytes
-        data = rang * dataraw * 10.0 / divis + offs
-        self.traces[trace_to_get - 1].y = data
+            self._window = (record, start, end)
+            n = len(codes) // average
+            y.append(codes[: n * average].reshape(n, average).mean(axis=1))
+            t.append(start + np.arange(n) * average + (average - 1) / 2.0)
+        y = np.concatenate(y)
+        y *= gain
+        y += meta["offset"]
+        return np.concatenate(t) / meta["srate"], y
+
+    def iter_binary(self, tracenum=None, chunk=1000000, start=0, end=None, progress=None, cancel=None, fmt=FORMAT_WORD):
+        """ Generator downloading the data of trace ``tracenum`` (default: current trace) by windows of ``chunk``
+        points (:WAV:STAR/:WAV:END), for records too large for one transfer. Memory use does not depend on the
+        record length. Yields ``(index of the first point, codes)``; volts are ``codes * gain + offset`` with
+        ``gain = yrange * 10 / divisor`` (``BINARY_FORMATS[fmt][2]``), ``yrange`` and ``offset`` from
+        ``waveform_metadata(tracenum)``. The trace and its codes are left unchanged.
+        ``start``, ``end``: range of points to download (default: the whole record).
+        ``progress``: function called with ``(points done, points total)`` after each window.
+        ``cancel``: ``threading.Event`` (or function returning True) checked between windows to stop the download.
+        ``fmt``: ``'16bit'`` (int16 codes) or ``'8bit'`` (int8 codes) transfer.
+        """
+        datatype, dtype, divis = self._binary_format(fmt)
+        if tracenum is None:
+            trace_to_get = int(self.trace_current)
+        elif tracenum in self.active_traces:
+            trace_to_get = int(tracenum)
+            if trace_to_get != self.trace_current:
+                self.current_trace(trace_to_get)
+        else:
+            ERR("Trace {0} not enabled, cannot read data.".format(tracenum))
+            return
 
-        return np.array(data)
+        meta = self.waveform_metadata(trace_to_get)
+        end = meta["N"] if end is None else min(end, meta["N"])
+        total = end - start
+
+        # timeout for one window: twice the typical 1 min per 1e6 points (2e6 bytes)
+        old_timeout = self.visa_instr.timeout
+        self.visa_instr.timeout = max(old_timeout, 0.06 * chunk * np.dtype(dtype).itemsize)
+        try:
+            for first in range(start, end, chunk):
+                if cancel is not None and (cancel.is_set() if hasattr(cancel, "is_set") else cancel()):
+                    WARN("Download of trace {0} cancelled at point {1}/{2}".format(trace_to_get, first - start, total))
+                    return
+                last = min(first + chunk, end)
+                self._set_window(first, last - 1)
+                codes = self.query_binary_values(
+                    ":WAV:SEND?",
+                    header_fmt='ieee',
+                    datatype=datatype,
+                    is_big_endian=False,
+                    container=np.array,
+                    delay=None,
+                )
+                yield first, codes
+                if progress is not None:
+                    progress(last - start, total)
+        finally:
+            self.visa_instr.timeout = old_timeout
+
+    def download(self, filename, tracenum=None, chunk=1000000, dtype=None, progress=None, cancel=None, fmt=FORMAT_WORD):
+        """ Downloads trace ``tracenum`` (default: current trace) by windows of ``chunk`` points (see ``iter_binary``)
+        into the memory-mapped .npy file ``filename`` (read it back with ``np.load(filename, mmap_mode='r')``).
+        ``dtype``: None stores the raw codes (int16 for ``fmt='16bit'``, int8 for ``'8bit'``), a float dtype stores volts.
+        The trace settings (with ``yrange``, ``offset`` and ``divisor`` to scale the codes) are saved in ``filename + '.json'``.
+        Returns the memory-mapped array; if cancelled, only the points downloaded.
+        """
+        if tracenum is None:
+            tracenum = int(self.trace_current)
+        if tracenum not in self.active_traces:
+            ERR("Trace {0} not enabled, cannot read data.".format(tracenum))
+            return RETURN_ERROR
+        meta = self.waveform_metadata(tracenum)
+        N = meta["N"]
+        _, code_dtype, divis = self._binary_format(fmt)
+        gain, offset = meta["yrange"] * 10.0 / divis, meta["offset"]
+        dtype = np.dtype(code_dtype if dtype is None else dtype)
+        out = np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=(N,))
+        done = 0
+        for first, codes in self.iter_binary(tracenum, chunk, progress=progress, cancel=cancel, fmt=fmt):
+            if dtype.kind == 'i':
+                out[first : first + len(codes)] = codes
+            else:
+                block = out[first : first + len(codes)]
+                np.multiply(codes, gain, out=block, casting='unsafe')
+                block += dtype.type(offset)
+            done = first + len(codes)
+        out.flush()
+        with open(filename + ".json", "w") as f:
+            json.dump(dict(self.traces[tracenum - 1].metadata(), **meta, divisor=divis), f)
+        return out if done == N else out[:done]
+
+    def acquire_continuous(self, traces=None, count=None, fmt=FORMAT_WORD, poll=0.005):
+        """ Generator of repeated single acquisitions with the transfer of each record overlapping the next acquisition.
+        As soon as a record is complete (frozen in history memory), the next acquisition is started, then the
+        previous record (history record -1) is transferred while the new one is acquired.
+        ``traces``: list of active traces (default: all), ``count``: number of records (default: until the generator is closed).
+        Yields ``(data, cycle)``: ``data`` is the ``(channels, N)`` array in volts (see ``get_binary_all``) and ``cycle``
+        a dictionary of durations in s: ``rearm`` (end of record detected to next start), ``transfer``, ``wait``
+        (for the end of the acquisition after the transfer) and ``overrun`` (True if the acquisition was already
+        complete when the transfer ended: the scope was idle for part of the transfer).
+        Totals and maxima of the cycle durations are in ``self.continuous_stats``. When the generator ends,
+        acquisition is stopped and the trigger mode restored.
+        """
+        if not self.active_traces:
+            WARN("Couldn't start acquisition: no active trace")
+            return
+        trigger_mode = self.trigger_mode()
+        self.trigger_mode("SING")
+        self.continuous_stats = stats = {
+            "records": 0,
+            "overruns": 0,
+            "rearm": {"total": 0.0, "max": 0.0},
+            "transfer": {"total": 0.0, "max": 0.0},
+            "wait": {"total": 0.0, "max": 0.0},
+        }
+        self.start()
+        try:
+            n = 0
+            while count is None or n < count:
+                t0 = time.perf_counter()
+                waited = False
+                while self.running():
+                    waited = True
+                    time.sleep(poll)
+                t_done = time.perf_counter()
+                # re-arm first: the record just completed becomes history record -1
+                if count is None or n + 1 < count:
+                    self.start()
+                    record = -1
+                else:
+                    record = 0  # last record: nothing to acquire during its transfer
+                t_armed = time.perf_counter()
+                data, scales = self.get_binary_all(traces, fmt=fmt, record=record)
+                t_transferred = time.perf_counter()
+                cycle = {
+                    "rearm": t_armed - t_done,
+                    "transfer": t_transferred - t_armed,
+                    "wait": t_done - t0,
+                    "overrun": n > 0 and not waited,
+                }
+                stats["records"] += 1
+                stats["overruns"] += cycle["overrun"]
+                for key in ("rearm", "transfer", "wait"):
+                    stats[key]["total"] += cycle[key]
+                    stats[key]["max"] = max(stats[key]["max"], cycle[key])
+                n += 1
+                yield data, cycle
+        finally:
+            self.stop()
+            self.trigger_mode(trigger_mode)
+
+    def history_records(self):
+        """ Returns the number of records in history memory (records 0 to ``1 - history_records()``) """
+        return 1 - self._to_int(self.query(":HIST:REC? MIN"))
+
+    def history_clear(self):
+        """ Clears the history memory (records of previous acquisitions) """
+        self.write(":HIST:CLE")
+
+    def capture_history(self, count, timeout=None, poll=0.05):
+        """ Captures ``count`` triggers in history memory at the full trigger rate (N single trigger mode, no
+        transfer between triggers), waits for the end of the acquisitions (at most ``timeout`` s) and returns
+        the number of records in history memory. Download them with ``get_history()``.
+        The trigger mode and acquisition count are restored after the capture.
+        """
+        mode, acq_count = self.query(":TRIG:MODE?;:ACQ:COUN?").split(";")
+        self.write(":TRIG:MODE NSIN;:ACQ:COUN {0}".format(int(count)))
+        try:
+            if self.start() is RETURN_ERROR:
+                return RETURN_ERROR
+            t0 = time.perf_counter()
+            while self.running():
+                if timeout is not None and time.perf_counter() - t0 > timeout:
+                    WARN("{0} triggers not captured after {1} s, stopping".format(count, timeout))
+                    self.stop()
+                    break
+                time.sleep(poll)
+        finally:
+            self.write(":TRIG:MODE {0};:ACQ:COUN {1}".format(mode.strip(), acq_count.strip()))
+        n = self.history_records()
+        if n < count:
+            WARN("{0} records in history memory instead of {1}".format(n, count))
+        return n
+
+    def get_history(self, tracenum=None, records=None, filename=None, dtype=None, fmt=FORMAT_WORD, progress=None, cancel=None):
+        """ Downloads history records of trace ``tracenum`` (default: current trace) in one session: the window is
+        set once, then each record costs one message (record selection and transfer).
+        ``records``: record indices (0 last, -1 previous...), default all records in history memory, oldest first.
+        ``filename``: if given, records are written in this memory-mapped .npy file instead of an array in memory.
+        ``dtype``: None for the raw codes (int16, int8 for ``fmt='8bit'``), or a float dtype for volts.
+        ``progress`` and ``cancel`` as in ``iter_binary``.
+        Returns the ``(records, N)`` array; volts are ``codes * gain + offset`` with ``gain = yrange * 10 / divisor``
+        as in ``iter_binary`` (saved in the .json file). The trace and its codes are left unchanged.
+        """
+        datatype, code_dtype, divis = self._binary_format(fmt)
+        if tracenum is None:
+            trace_to_get = int(self.trace_current)
+        elif tracenum in self.active_traces:
+            trace_to_get = int(tracenum)
+            if trace_to_get != self.trace_current:
+                self.current_trace(trace_to_get)
+        else:
+            ERR("Trace {0} not enabled, cannot read data.".format(tracenum))
+            return RETURN_ERROR
+        if records is None:
+            records = range(1 - self.history_records(), 1)
+        records = list(records)
+
+        meta = self.waveform_metadata(trace_to_get)
+        N = meta["N"]
+        dtype = np.dtype(code_dtype if dtype is None else dtype)
+        if filename is None:
+            out = np.empty((len(records), N), dtype=dtype)
+        else:
+            out = np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=(len(records), N))
+        gain, offset = meta["yrange"] * 10.0 / divis, meta["offset"]
+
+        self._set_window(0, N - 1, records[0] if records else 0)
+        # each message selects its record: the window is unknown until a transfer completed
+        window, self._window = self._window, None
+        done = 0
+        try:
+            for i, record in enumerate(records):
+                if cancel is not None and (cancel.is_set() if hasattr(cancel, "is_set") else cancel()):
+                    WARN("Download of history cancelled at record {0}/{1}".format(i, len(records)))
+                    break
+                window = None
+                codes = self.query_binary_values(
+                    ":WAV:REC {0};:WAV:SEND?".format(record),
+                    header_fmt='ieee',
+                    datatype=datatype,
+                    is_big_endian=False,
+                    container=np.array,
+                    delay=None,
+                )
+                window = (record, 0, N - 1)
+                if dtype.kind == 'i':
+                    out[i] = codes
+                else:
+                    np.multiply(codes, gain, out=out[i], casting='unsafe')
+                    out[i] += dtype.type(offset)
+                done = i + 1
+                if progress is not None:
+                    progress(done, len(records))
+        finally:
+            self._window = window
+        if filename is not None:
+            out.flush()
+            with open(filename + ".json", "w") as f:
+                json.dump(dict(self.traces[trace_to_get - 1].metadata(), **meta, divisor=divis, records=records[:done]), f)
+        return out if done == len(records) else out[:done]
+
+    def benchmark_formats(self, tracenum=None, repeat=3):
+        """ Measures the transfer of trace ``tracenum`` (default: current trace) in ASCII, 8-bit and 16-bit formats.
+        Returns and prints, for each format, the best time of ``repeat`` transfers and the points/s.
+        """
+        if tracenum is None:
+            tracenum = int(self.trace_current)
+        fetch = {
+            FORMAT_ASCII: lambda: self.get_ascii(tracenum),
+            FORMAT_BYTE: lambda: self.get_binary(tracenum, fmt=FORMAT_BYTE),
+            FORMAT_WORD: lambda: self.get_binary(tracenum, fmt=FORMAT_WORD),
+        }
+        results = {}
+        for fmt, get in fetch.items():
+            get()  # format change and settings out of the measurement
+            best = np.inf
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                data = get()
+                best = min(best, time.perf_counter() - t0)
+            results[fmt] = {"seconds": best, "points_per_s": len(data) / best}
+            INFO(
+                "{0:>6}: {1:.3f} s for {2} points ({3:.3g} points/s)".format(
+                    fmt, best, len(data), results[fmt]["points_per_s"]
+                )
+            )
+        return results
 
     def get_binary_old(self, tracenum=None):
         """ Returns the data acquired in trace number given in argument (default: current trace) using binary transfer
@@ -1130,35 +1821,30 @@ class Yoko750(instr.Instr):
         self.traces[trace_to_get - 1].ac_coupled = self.ac_coupled(trace_to_get)
         self.traces[trace_to_get - 1].module = self.query(":WAV:MOD?")
         self.traces[trace_to_get - 1].srate = float(self.query(":WAV:SRAT?"))
-        self.traces[trace_to_get - 1].x = (
-            np.arange(N) / self.traces[trace_to_get - 1].srate
-        )
+        self.traces[trace_to_get - 1].x = None  # recomputed from N and srate when used
         self.traces[trace_to_get - 1].probe = self.query_ascii_values(
             ":CHAN{0}:PROB?".format(trace_to_get)
         )[0]
         self.traces[trace_to_get - 1].averaging = self.averaging()
 
         self.traces[trace_to_get - 1].N = N
-        self.write(
-            ":WAV:STAR 0"
-        )  # changement Joël et JD -> Définition du premier point de l'acquisition 17Oct16
-        self.write(":WAV:END {0}".format(N - 1))
+        # changement Joël et JD -> Définition du premier point de l'acquisition 17Oct16
+        self._set_window(0, N - 1)
         # function query_binary_values() from pyvisa module with parameter header_fmt='ieee' removes the IEEE header #<id><data_length><data>
-        dataraw = np.array(
-            self.visa_instr.query_binary_values(
-                ":WAV:SEND?",
-                header_fmt='ieee',
-                datatype='h',
-                is_big_endian=True,
-                delay=None,
-            )
+        dataraw = self.query_binary_values(
+            ":WAV:SEND?",
+            header_fmt='ieee',
+            datatype='h',
+            is_big_endian=True,
+            container=np.array,
+            delay=None,
         )  # datatype 'h' is for short = 2 bytes
-        data = rang * dataraw * 10 / divis + offs
-        self.traces[trace_to_get - 1].y = data
+        self.traces[trace_to_get - 1].set_codes(dataraw, rang, offs, divis)
+        data = self.traces[trace_to_get - 1].values()
 
         self.visa_instr.timeout = old_timeout
 
-        return np.array(data)
+        return data
 
     def get_binary_quick(self, tracenum):
         """ Quick version of get_binary
@@ -1210,25 +1896,21 @@ class Yoko750(instr.Instr):
         # function query_binary_values() from pyvisa module with parameter header_fmt='ieee' removes the IEEE header #<id><data_length><data>
         # dataraw = np.array(self.visa_instr.query_binary_values(":WAV:SEND?", header_fmt='ieee', datatype='h', is_big_endian=False, delay=None)) # datatype 'h' is for short = 2 bytes
         ## changement par léo : test de is_big_endian=True plutot que is_big_endian=False comme au dessus (original inchangé)
-        dataraw = np.array(
-            self.visa_instr.query_binary_values(
-                ":WAV:SEND?",
-                header_fmt='ieee',
-                datatype='h',
-                is_big_endian=True,
-                delay=None,
-            )
+        dataraw = self.query_binary_values(
+            ":WAV:SEND?",
+            header_fmt='ieee',
+            datatype='h',
+            is_big_endian=True,
+            container=np.array,
+            delay=None,
         )  # datatype 'h' is for short = 2 bytes
         divis = 24000.0
-        data = (
-            self.traces[trace_to_get - 1].yrange * dataraw * 10 / divis
-            + self.traces[trace_to_get - 1].offset
-        )
-        self.traces[trace_to_get - 1].y = data
+        self.traces[trace_to_get - 1].set_codes(dataraw, divisor=divis)
+        data = self.traces[trace_to_get - 1].values()
 
         self.visa_instr.timeout = old_timeout
 
-        return np.array(data)
+        return data
 
     def bandwidth(self, numtrace=None, bandwidth=None):
         """ Query or set the bandwidth of trace ``numtrace`` (current trace for None).
@@ -1260,6 +1942,7 @@ class Yoko750(instr.Instr):
         else:
             ERR("bandwidth must be 0 (for FULL) or a frequency as a float value.")
             return RETURN_ERROR
+        self.invalidate_metadata(tr)
 
         tmp = self.query(":CHAN{0}:BWID?".format(tr))
         if tmp == "FULL":
@@ -1315,6 +1998,7 @@ class Yoko750(instr.Instr):
         else:
             ERR("2nd parameter must be True or False, or None for query.")
             return RETURN_ERROR
+        self.invalidate_metadata(tr)
 
         return RETURN_NO_ERROR
 
@@ -1356,6 +2040,7 @@ class Yoko750(instr.Instr):
         else:
             ERR("2nd parameter must be True or False, or None for query.")
             return RETURN_ERROR
+        self.invalidate_metadata(tr)
 
         return RETURN_NO_ERROR
 
@@ -1406,7 +2091,7 @@ class Yoko750(instr.Instr):
         from textwrap import dedent
 
         if traces is None:
-            tr = self.current_trace()
+            tr = [self.current_trace()]
         elif isinstance(traces, list):
             all_good = True
             for t in traces:
@@ -1421,7 +2106,7 @@ class Yoko750(instr.Instr):
                 return RETURN_ERROR
             tr = traces
         elif isinstance(traces, int) and traces in self.active_traces:
-            tr = list(traces)
+            tr = [traces]
         else:
             ERR(
                 "``traces`` argument must be None for current trace, the number of an active trace (in {0}), or a list of active traces numbers.".format(
@@ -1471,7 +2156,7 @@ class Yoko750(instr.Instr):
         colour_list = DEFAULT_COLOR_LIST + DEFAULT_COLOR_LIST_FADED
 
         # TODO:  CHECK IF SERIES IS THE SAME (OR CREATE DIFFERENT FOLDERS : check for tr[0] in code) and CHECK THAT LABELS ARE ALL DIFFERENT otherwise bug
-        header = "IGOR\nWAVES"
+        names = []
         igor_script = 'X NewDataFolder/O root:Data\n'
         igor_script += 'NewDataFolder/O root:Data:{series}\n'.format(
             series=self.traces[tr[0] - 1].series
@@ -1479,8 +2164,10 @@ class Yoko750(instr.Instr):
         # igor_script += 'SetDataFolder root:Data:\n'
 
         for t in tr:
-            header += "\t{series}_{label}".format(
-                series=self.traces[t - 1].series, label=self.traces[t - 1].label
+            names.append(
+                "{series}_{label}".format(
+                    series=self.traces[t - 1].series, label=self.traces[t - 1].label
+                )
             )
             igor_script += 'SetScale/P x,0,{dt},"s",{series}_{label}\nSetScale d,0,0,"{unit}",{series}_{label}\n'.format(
                 dt=1 / self.traces[t - 1].srate,
@@ -1496,16 +2183,9 @@ class Yoko750(instr.Instr):
             igor_script += 'MoveWave {series}_{label}, root:Data:{series}:\n'.format(
                 series=self.traces[t - 1].series, label=self.traces[t - 1].label
             )
-            igor_script += '// Line below is a Python dictionary containing measurement information'
-            igor_script += '// {dic}'.format(
-                dic={
-                    key: value
-                    for key, value in self.traces[t - 1].__dict__.items()
-                    if not key.startswith('__')
-                    and not callable(key)
-                    and key != 'x'
-                    and key != 'y'
-                }
+            igor_script += '// Line below is a Python dictionary containing measurement information\n'
+            igor_script += '// {dic}\n'.format(
+                dic=self.traces[t - 1].metadata()
             )
 
         igor_script += 'String/G root:fldrSav0=GetDataFolder(1)\n'
@@ -1522,7 +2202,7 @@ class Yoko750(instr.Instr):
                     for t in tr
                 ]
             )
-            + ' as "{series}"\n'.format(series=self.traces[tr[0]].series)
+            + ' as "{series}"\n'.format(series=self.traces[tr[0] - 1].series)
         )
         igor_script += 'SetDataFolder root:fldrSav0\n'
         igor_script += (
@@ -1552,7 +2232,7 @@ class Yoko750(instr.Instr):
         igor_script += 'Label bottom "\\\\Z12\\\\f01\\\\U"\n'
         igor_script += (
             'Legend/C/N={series}Legend/J/F=0/B=1 "'.format(
-                series=self.traces[tr[0]].series
+                series=self.traces[tr[0] - 1].series
             )
             + '\\r'.join(
                 [
@@ -1565,29 +2245,53 @@ class Yoko750(instr.Instr):
             + '"'
         )
 
-        header += "\nBEGIN"
-        footer = "END\n" + "X ".join(dedent(igor_script).splitlines(True))
+        footer = "X ".join(dedent(igor_script).splitlines(True)) + "\n"
 
-        X = np.sum(
-            np.array(
-                [
-                    np.array([np.eye(len(tr))[n]]).transpose()
-                    * self.traces[tr[n] - 1].y
-                    / self.traces[tr[n] - 1].gain
-                    for n in range(len(tr))
-                ]
-            ),
-            1,
-        ).transpose()
-        np.savetxt(
+        # one column per trace, scaled by blocks from the codes (or the values)
+        columns, scales = zip(*[self._export_data(t) for t in tr])
+        igor.write_itx(
             filename,
-            X,
-            fmt="\t% .16e",
-            delimiter='',
-            newline='\n',
-            comments='',
-            header=header,
-            footer=footer,
+            columns,
+            names,
+            scales=scales,
+            fmt="% .16e",
+            commands=footer,
         )
 
         return RETURN_NO_ERROR
+
+    def _export_data(self, numtrace):
+        # (data, (gain, offset)) of a trace for export, values divided by the gain set with info_trace()
+        tr = self.traces[numtrace - 1]
+        if tr.codes is not None:
+            gain, offset = tr.scale
+            return tr.codes, (gain / tr.gain, offset / tr.gain)
+        return tr.y, (1.0 / tr.gain, 0.0)
+
+    def save_ibw(self, prefix, traces=None):
+        """ Saves traces (default: all active traces) as Igor binary waves ``{prefix}{series}_{label}.ibw``
+        (single precision, x scaling from the sample rate, trace settings in the wave note).
+        Data is converted by blocks from the raw codes: no full-size copy, whatever the record length.
+        Returns the list of files written.
+        """
+        if traces is None:
+            traces = list(self.active_traces)
+        elif isinstance(traces, int):
+            traces = [traces]
+        files = []
+        for t in traces:
+            tr = self.traces[t - 1]
+            name = "{series}_{label}".format(series=tr.series, label=tr.label)
+            data, scale = self._export_data(t)
+            filename = "{0}{1}.ibw".format(prefix, name)
+            igor.write_ibw(
+                filename,
+                data,
+                name,
+                dx=1 / tr.srate if tr.srate else 1.0,
+                data_unit=tr.unit,
+                note="Scaling: {gain}\r{meta}".format(gain=tr.gain, meta=tr.metadata()),
+                scale=scale,
+            )
+            files.append(filename)
+        return files
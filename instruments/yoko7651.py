@@ -16,7 +16,10 @@ from time import sleep
 from contextlib import contextmanager
 
 class Yoko7651(instr.Instr):
-	def __init__(self, visa_name, visa_library=''):
+	clear_on_recovery = False	# device clear resets the 7651 (see clean())
+	persistent_state = ("idn", "range_code", "function", "range_i", "range_v", "meas_mode", "value", "limit_v", "limit_i", "is_output_on")
+
+	def __init__(self, visa_name, visa_library='', warm_restart=True):
 		super(Yoko7651, self).__init__(visa_name, visa_library)
 		self.visa_instr.write_termination = "\n"
 		#self.visa_instr.baud_rate = 9600
@@ -38,15 +41,38 @@ class Yoko7651(instr.Instr):
 			{"mode":"CURRENT","value":120e-3,"code":"F5R6"}
 			]
 
-		self.write("OS")
-		self.idn = self.read()
-		tmp = self.read()
+		self._clean = False
+		self.__writing_program__ = False
+
+		# warm restart: state saved by the last clean(), confirmed by the output status (OC), one query instead
+		# of the 5-line OS status. The 7651 identifies itself only in the OS status, by model and firmware
+		# (the same for every unit): the state is keyed by resource, its idn is the one saved with it.
+		if not (warm_restart and self.load_state() and self._restored_state_is_valid()):
+			self._read_status()
+			self.is_output_on = self.output()
+
+	def _restored_state_is_valid(self):
+		restored = self.is_output_on
+		return self.output() == restored
+
+	def _read_status(self):
+		"""
+		Reads the OS status (5 lines) and updates idn, function, ranges and limits
+		"""
+		# the OS answer spans 5 reads that must not be interleaved with other traffic on the board
+		with self.transaction():
+			self.write("OS")
+			self.idn = self.read()
+			tmp = self.read()
+			self.read()
+			tmp2 = self.read().split("LA")
+			self.read()
 		self.range_code = tmp[0:4]
 		self.function = [x["mode"] for x in self.ranges if x["code"]==self.range_code][0]
 		self.range_i = None
 		self.range_v = None
 		if self.function == "CURRENT":
-			self.range_i = [x["mode"] for x in self.ranges if x["code"]==self.range_code][0]
+			self.range_i = [x["value"] for x in self.ranges if x["code"]==self.range_code][0]
 		elif self.function == "VOLTAGE":
 			self.range_v = [x["value"] for x in self.ranges if x["code"]==self.range_code][0]
 		else:
@@ -54,18 +80,27 @@ class Yoko7651(instr.Instr):
 
 		self.meas_mode = tmp[4:5]
 		self.value = tmp
-		self.read()
-		tmp = self.read().split("LA")
-		self.limit_v = float(tmp[0][3:])
-		self.limit_i = float(tmp[1])/1000
-		self.read()
-
-		self.is_output_on = self.output()
-		
-		self._clean = False
-		self.__writing_program__ = False
+		self.limit_v = float(tmp2[0][3:])
+		self.limit_i = float(tmp2[1])/1000
+
+	def get_metadata(self):
+		"""
+		Returns function, range, limits and output state as read from the instrument
+		"""
+		with self.transaction():
+			self._read_status()
+			output = self.output()
+		return {
+			"function": self.function,
+			"range_code": self.range_code,
+			"range": self.range_v if self.function == "VOLTAGE" else self.range_i,
+			"limit_v": self.limit_v,
+			"limit_i": self.limit_i,
+			"output": output,
+			}
 
 	def clean(self):
+		self.save_state()
 		# self.visa_instr.clear() ##don't use clear for yoko651. It resets it, and makes it bug (need to switch on/off)
 		self.visa_instr.close()
 		self._clean = True
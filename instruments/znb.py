@@ -4,27 +4,37 @@ import numpy as np
 
 class Znb(instr.Instr):
 
-    def __init__(self, visa_name, visa_library=''): # '' is recognized as default visa DLL by pyvisa
+    persistent_state = ("current_channel", "current_measurement_name", "current_trace_number")
+
+    def __init__(self, visa_name, visa_library='', warm_restart=True): # '' is recognized as default visa DLL by pyvisa
         super(Znb, self).__init__(visa_name, visa_library)
         self.cls()
         # self.current_channel = 0
         # self.current_measurement_name = None
         self.visa_instr.read_termination = '\n'
         self.visa_instr.timeout = 50000
+        self.idn = self.get_idn()
         self.write("ROSCillator INTernal")
-        channel = self.list_channels()
-        if channel:
-            self.current_channel = channel[0]
-            trace = self.list_traces(self.current_channel)
-            if trace:
-                self.current_measurement_name = trace[0]
+        # warm restart: channel and trace saved by the last clean(), confirmed by one query
+        if warm_restart and self.load_state(self.idn) and self._restored_state_is_valid():
+            self.write("CALCulate{0}:PARameter:SELect '{1}'".format(self.current_channel, self.current_measurement_name))
+        else:
+            channel = self.list_channels()
+            if channel:
+                self.current_channel = channel[0]
+                trace = self.list_traces(self.current_channel)
+                if trace:
+                    self.current_measurement_name = trace[0]
+                else:
+                    return False
             else:
                 return False
-        else:
-            return False
-        self.set_current_channel_and_trace(self.current_channel, self.current_measurement_name)
+            self.set_current_channel_and_trace(self.current_channel, self.current_measurement_name)
         self.set_data_format("ASCII")
 
+    def _restored_state_is_valid(self):
+        return self.current_measurement_name in self.list_traces(self.current_channel)
+
 
 
 
@@ -126,8 +136,8 @@ class Znb(instr.Instr):
     def get_trace_sdata(self, trace_name):
         self.write("FORMAT REAL,64")
         self.write(f"CALC{self.current_channel}:PAR:SEL '{trace_name}'")
-        f = self.visa_instr.query_binary_values(f":CALC{self.current_channel}:DATA:STIM?", datatype='d')
-        values_interlaced = np.array(self.visa_instr.query_binary_values(f":CALC{self.current_channel}:DATA? SDAT", datatype='d'))
+        f = self.query_binary_values(f":CALC{self.current_channel}:DATA:STIM?", datatype='d')
+        values_interlaced = np.array(self.query_binary_values(f":CALC{self.current_channel}:DATA? SDAT", datatype='d'))
         # values_interlaced = np.array([float(txt) for txt in text.split(',')])
         z = values_interlaced[0::2] + 1j*values_interlaced[1::2]
         return np.array(f),np.array(z)
@@ -199,17 +209,7 @@ class Znb(instr.Instr):
 
     #print current state of VNA
     def get_state(self):
-        meta = {
-            'center': float(self.query(f'SENS{self.current_channel}:FREQ:CENT?')),
-            'span': float(self.query(f'SENS{self.current_channel}:FREQ:SPAN?')),
-            'start': float(self.query(f'SENS{self.current_channel}:FREQ:STAR?')),
-            'stop': float(self.query(f'SENS{self.current_channel}:FREQ:STOP?')),
-            'nb_points': int(self.query(f'SENS{self.current_channel}:SWE:POIN?')),
-            'VBW': int(self.query(f'SENS{self.current_channel}:BAND?')),
-            'trace_param': self.get_trace_param(),
-            'sweep_type': self.query(f'SENS{self.current_channel}:SWE:TYPE?'),
-            'power': self.get_power()
-            }
+        meta = self.get_metadata()
         print('\n Current state of VNA is : \n')
         print(f'center is at {meta["center"]*1e-9} GHz')
         print(f'span is of {meta["span"]*1e-6} MHz')
@@ -222,6 +222,27 @@ class Znb(instr.Instr):
         print(f'Trace and channel parameters: {meta["trace_param"]}')
         print()
 
+    # same fields as get_state(), fetched with a single compound query
+    def get_metadata(self):
+        ch = self.current_channel
+        answer = self.query(
+            f'SENS{ch}:FREQ:CENT?;:SENS{ch}:FREQ:SPAN?;:SENS{ch}:FREQ:STAR?;:SENS{ch}:FREQ:STOP?;'
+            f':SENS{ch}:SWE:POIN?;:SENS{ch}:BAND?;:SENS{ch}:SWE:TYPE?;:SOUR{ch}:POW?;:CALC{ch}:PAR:CAT?'
+        )
+        # the trace catalog comes last: it is the only answer that may contain separators
+        values = answer.split(';', 8)
+        return {
+            'center': float(values[0]),
+            'span': float(values[1]),
+            'start': float(values[2]),
+            'stop': float(values[3]),
+            'nb_points': int(values[4]),
+            'VBW': int(float(values[5])),
+            'sweep_type': values[6],
+            'power': float(values[7]),
+            'trace_param': values[8],
+            }
+
     def get_trace_param(self):
         return self.query(f'CALC{self.current_channel}:PAR:CAT?')
 
@@ -254,9 +275,17 @@ class Znb(instr.Instr):
         self.write("INITiate{0}:IMMediate".format(self.current_channel))
 
     def set_trigger_manual(self):
-        self.write("TRIGger{0}:SOURce MANual".format(self.current_channel))
+        self.set_trigger_source("MANual")
+
+    # single sweeps started by the trigger ``source``: MANual (*TRG), EXTernal (trigger input), IMMediate...
+    def set_trigger_source(self, source):
+        self.write("TRIGger{0}:SOURce {1}".format(self.current_channel, source))
         self.write("INITiate{0}:CONTinuous OFF".format(self.current_channel))
 
+    # number of sweeps completed since the last INITiate (sweeps started by triggers)
+    def get_nb_sweeps_done(self):
+        return int(float(self.query("CALCulate{0}:DATA:NSWeep:COUNt?".format(self.current_channel))))
+
     def send_trigger(self):
         # self.write("TRIGger:SCOPe CURRent")
         self.write("TRIGger:SOURce IMMediate")
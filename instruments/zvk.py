@@ -1,4 +1,5 @@
 from instruments import instr
+from instruments import memory
 import numpy as np
 # from time import sleep
 
@@ -14,8 +15,9 @@ class Zvk(instr.Instr):
         self.current_channel = 1
         self.write("ROSCillator INTernal")
         self.set_data_format("REAL, 32")
-        self.f = dict()
-        self.z = dict()
+        # last trace of each name, evicted (least recently used first) beyond the memory budget
+        self.f = memory.CacheDict(self.memory, "f")
+        self.z = memory.CacheDict(self.memory, "z")
 
 
 
@@ -284,9 +286,10 @@ class Zvk(instr.Instr):
             z = None
 
         for t in traces:
-            f = np.array(self.visa_instr.query_binary_values(f'trace:stimulus? {t}', is_big_endian=False))
-            tmp = self.visa_instr.query_binary_values(f'trace? {t}', is_big_endian=False)
-            z = np.array(tmp[::2]) + 1j*np.array(tmp[1::2])
+            f = np.array(self.query_binary_values(f'trace:stimulus? {t}', is_big_endian=False))
+            # REAL,32 transfer: (re, im) float32 pairs viewed as complex64 without copy (half the size of complex128)
+            tmp = self.query_binary_values(f'trace? {t}', is_big_endian=False, container=np.array)
+            z = np.ascontiguousarray(tmp, dtype=np.float32).view(np.complex64)
             self.f[t] = f
             self.z[t] = z
 
@@ -0,0 +1,115 @@
+# Shared fixtures: a scripted VISA resource replacing pyvisa.ResourceManager, a temporary state
+# directory and a minimal Instr driver, so that the generic driver code runs without hardware.
+
+import pyvisa
+import pytest
+
+from instruments import instr
+from instruments import state_cache
+
+TIMEOUT = pyvisa.errors.VisaIOError(pyvisa.constants.VI_ERROR_TMO)
+
+
+class FakeResource(object):
+    """VISA resource answering queries from ``answers`` ({command: answer}); ``failures`` lists
+    the commands (or method names) whose next call raises a timeout
+    """
+
+    def __init__(self, name, manager):
+        self.name = name
+        self.manager = manager
+        self.timeout = 2000
+        self.read_termination = None
+        self.write_termination = "\r\n"
+        self.chunk_size = 20 * 1024
+        self.query_delay = 0.0
+        self.closed = False
+        self.log = []
+
+    def _call(self, key):
+        self.log.append(key)
+        if key in self.manager.failures:
+            self.manager.failures.remove(key)
+            raise TIMEOUT
+
+    def write(self, command):
+        self._call(command)
+
+    def read(self):
+        self._call("read")
+        return ""
+
+    def query(self, command, **kwargs):
+        self._call(command)
+        return self.manager.answers.get(command, "")
+
+    def query_ascii_values(self, command, **kwargs):
+        return [float(x) for x in self.query(command).split(",")]
+
+    def read_stb(self):
+        self._call("read_stb")
+        return 0
+
+    def clear(self):
+        self.log.append("<clear>")
+
+    def close(self):
+        self.closed = True
+
+
+class FakeResourceManager(object):
+    def __init__(self):
+        self.answers = {"*IDN?": "FAKE,INSTRUMENT,0,1.0"}
+        self.failures = []
+        self.opened = []
+
+    def __call__(self, visa_library=""):
+        return self
+
+    def open_resource(self, name):
+        resource = FakeResource(name, self)
+        self.opened.append(resource)
+        return resource
+
+
+@pytest.fixture
+def visa_rm(monkeypatch):
+    manager = FakeResourceManager()
+    monkeypatch.setattr(pyvisa, "ResourceManager", manager)
+    return manager
+
+
+@pytest.fixture
+def state_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(state_cache, "STATE_DIR", str(tmp_path / "state"))
+    return tmp_path / "state"
+
+
+class Driver(instr.Instr):
+    """Minimal driver: identification, one persistent attribute and one cache forgotten on recovery"""
+
+    persistent_state = ("channel",)
+
+    def __init__(self, visa_name="TCPIP::fake::INSTR"):
+        super(Driver, self).__init__(visa_name, "")
+        self.idn = self.get_idn()
+        self.channel = 1
+        self.cache = "settings read from the instrument"
+
+    def _on_recovery(self):
+        self.cache = None
+
+
+@pytest.fixture
+def make_driver(visa_rm, state_dir):
+    # drivers are released before the fixtures are undone: clean() saves their state in ``state_dir``
+    drivers = []
+
+    def make():
+        drivers.append(Driver())
+        return drivers[-1]
+
+    yield make
+    for d in drivers:
+        if not d._clean:
+            d.clean()
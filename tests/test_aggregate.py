@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from instruments import aggregate
+
+T0 = 1.7e9  # a realistic time.time(): float resolution matters for the bucket numbers
+
+
+def samples(n=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    t = T0 + np.sort(rng.uniform(0, 100, n))
+    x = 1e-3 + 1e-6 * rng.standard_normal(n)  # small variations on a large offset (lock-in voltages...)
+    return t, x
+
+
+def expected(t, x, width):
+    k = np.floor_divide(t, width)
+    out = {"count": [], "mean": [], "std": [], "min": [], "max": []}
+    for b in np.unique(k):
+        v = x[k == b]
+        out["count"].append(len(v))
+        out["mean"].append(v.mean())
+        out["std"].append(v.std(ddof=1) if len(v) > 1 else 0.0)
+        out["min"].append(v.min())
+        out["max"].append(v.max())
+    return {name: np.array(values) for name, values in out.items()}
+
+
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_bucket_statistics(vectorized):
+    t, x = samples()
+    agg = aggregate.Aggregator(((1.0, 200), (10.0, 20)))
+    if vectorized:
+        # in several batches, not sorted within a batch
+        order = np.random.default_rng(1).permutation(len(t))
+        for part in np.array_split(order, 7):
+            agg.add_many(x[part], t[part])
+    else:
+        for ti, xi in zip(t, x):
+            agg.add(xi, ti)
+    for width in (1.0, 10.0):
+        b = agg.query(T0, T0 + 100, resolution=width)
+        e = expected(t, x, width)
+        np.testing.assert_array_equal(b["count"], e["count"])
+        np.testing.assert_allclose(b["mean"], e["mean"], rtol=1e-12)
+        np.testing.assert_allclose(b["std"], e["std"], rtol=1e-6, atol=1e-15)
+        np.testing.assert_array_equal(b["min"], e["min"])
+        np.testing.assert_array_equal(b["max"], e["max"])
+
+
+def test_summary_merges_buckets():
+    t, x = samples()
+    agg = aggregate.Aggregator(((1.0, 200),))
+    agg.add_many(x, t)
+    s = agg.summary(T0, T0 + 100)
+    assert s["count"] == len(x)
+    assert s["mean"] == pytest.approx(x.mean(), rel=1e-12)
+    assert s["std"] == pytest.approx(x.std(ddof=1), rel=1e-6)
+    assert (s["min"], s["max"]) == (x.min(), x.max())
+    assert aggregate.Aggregator().summary(T0, T0 + 1)["count"] == 0
+
+
+def test_ring_keeps_last_buckets():
+    agg = aggregate.Aggregator(((1.0, 10),))
+    for i in range(25):
+        agg.add(float(i), T0 + i + 0.5)
+    b = agg.query(T0, T0 + 24.5, resolution=1.0)
+    np.testing.assert_array_equal(b["mean"], np.arange(15, 25))
+    # a batch longer than the ring keeps its last buckets
+    agg.add_many(np.arange(30.0), T0 + 100 + np.arange(30) + 0.5)
+    b = agg.query(T0 + 100, T0 + 129.5, resolution=1.0)
+    np.testing.assert_array_equal(b["mean"], np.arange(20, 30))
+
+
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_late_sample_does_not_reset_newer_bucket(vectorized):
+    agg = aggregate.Aggregator(((1.0, 10), (10.0, 10)))
+    agg.add(5.0, T0 + 10.5)
+    # 10 s late: same slot as the newer bucket at the 1 s resolution, still covered at 10 s
+    if vectorized:
+        agg.add_many([1.0], [T0 + 0.5])
+    else:
+        agg.add(1.0, T0 + 0.5)
+    fine = agg.query(T0, T0 + 11, resolution=1.0)
+    assert list(fine["count"]) == [1] and list(fine["mean"]) == [5.0]
+    coarse = agg.query(T0 - 10, T0 + 11, resolution=10.0)
+    assert coarse["count"].sum() == 2
+
+
+def test_save_and_load(tmp_path):
+    t, x = samples(500)
+    agg = aggregate.Aggregator(((1.0, 200), (10.0, 20)))
+    agg.add_many(x, t)
+    agg.save(tmp_path / "agg.npz")
+    loaded = aggregate.Aggregator.load(tmp_path / "agg.npz")
+    for width in (1.0, 10.0):
+        a = agg.query(T0, T0 + 100, resolution=width)
+        b = loaded.query(T0, T0 + 100, resolution=width)
+        for name in ("time", "count", "mean", "std", "min", "max"):
+            np.testing.assert_array_equal(a[name], b[name])
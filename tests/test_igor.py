@@ -0,0 +1,85 @@
+import struct
+
+import numpy as np
+import pytest
+
+from instruments import igor
+
+CODES = np.array([-32000, -1, 0, 1, 1234, 32000], dtype=np.int16)
+SCALE = (1e-4, 0.25)
+
+
+def _read_ibw(filename):
+    with open(filename, "rb") as f:
+        content = f.read()
+    headers = content[: igor._BIN_HEADER5.size + igor._WAVE_HEADER5.size]
+    bin_header = igor._BIN_HEADER5.unpack_from(content)
+    wave_header = igor._WAVE_HEADER5.unpack_from(content, igor._BIN_HEADER5.size)
+    npnts = wave_header[3]
+    data = np.frombuffer(content, dtype="<f4", count=npnts, offset=len(headers))
+    tail = content[len(headers) + 4 * npnts :]
+    return headers, bin_header, wave_header, data, tail
+
+
+def test_ibw_headers_and_data(tmp_path):
+    filename = str(tmp_path / "ch1.ibw")
+    igor.write_ibw(filename, CODES, "run1_CH1", dx=1e-6, x0=-2e-6, data_unit="V", note="gain=2", scale=SCALE)
+    headers, bin_header, wave_header, data, tail = _read_ibw(filename)
+    assert bin_header[0] == 5
+    assert np.frombuffer(headers, dtype="<i2").sum(dtype=np.int64) & 0xFFFF == 0
+    assert bin_header[2] == igor._WAVE_HEADER5.size + 4 * len(CODES)  # wfmSize
+    assert bin_header[4] == len("gain=2")  # noteSize
+    assert wave_header[3] == len(CODES) and wave_header[4] == igor.NT_FP32
+    assert wave_header[8].rstrip(b"\0") == b"run1_CH1"
+    assert wave_header[11] == len(CODES)  # nDim[0]
+    assert wave_header[15] == 1e-6 and wave_header[19] == -2e-6  # sfA[0], sfB[0]
+    assert wave_header[23].rstrip(b"\0") == b"V" and wave_header[24].rstrip(b"\0") == b"s"
+    # scaled in single precision
+    np.testing.assert_allclose(data, CODES * SCALE[0] + SCALE[1], rtol=1e-6)
+    assert tail == b"gain=2"
+
+
+def test_ibw_extended_units(tmp_path):
+    filename = str(tmp_path / "f.ibw")
+    igor.write_ibw(filename, np.linspace(0, 1, 5), "f", x_unit="Hz", data_unit="dBm")
+    _, bin_header, wave_header, data, tail = _read_ibw(filename)
+    assert wave_header[23].rstrip(b"\0") == b"dBm" and wave_header[24].rstrip(b"\0") == b"Hz"
+    np.testing.assert_allclose(data, np.linspace(0, 1, 5))
+    assert tail == b""
+    igor.write_ibw(filename, np.zeros(3), "f", x_unit="s", data_unit="Volts")
+    _, bin_header, wave_header, _, tail = _read_ibw(filename)
+    assert wave_header[23].rstrip(b"\0") == b"" and bin_header[5] == len("Volts")
+    assert tail == b"Volts"
+
+
+def test_ibw_read_by_igor2(tmp_path):
+    binarywave = pytest.importorskip("igor2.binarywave")
+    filename = str(tmp_path / "ch1.ibw")
+    igor.write_ibw(filename, CODES, "run1_CH1", dx=1e-6, note="gain=2", scale=SCALE)
+    wave = binarywave.load(filename)["wave"]
+    assert wave["wave_header"]["bname"] == b"run1_CH1"
+    assert wave["note"] == b"gain=2"
+    np.testing.assert_allclose(wave["wData"], CODES * SCALE[0] + SCALE[1], rtol=1e-6)
+
+
+def test_itx_round_trip(tmp_path):
+    filename = str(tmp_path / "run1.itx")
+    t = np.arange(len(CODES)) * 1e-6
+    commands = 'X SetScale/P x 0,1e-06,"s", run1_CH1\n'
+    igor.write_itx(filename, [t, CODES], ["t", "run1_CH1"], scales=[None, SCALE], commands=commands, block=4)
+    with open(filename) as f:
+        lines = f.read().split("\n")
+    assert lines[:3] == ["IGOR", "WAVES\tt\trun1_CH1", "BEGIN"]
+    end = lines.index("END")
+    assert end == 3 + len(CODES)
+    table = np.array([[float(v) for v in line.split("\t")] for line in lines[3:end]])
+    np.testing.assert_allclose(table[:, 0], t, rtol=1e-8)
+    np.testing.assert_allclose(table[:, 1], CODES * SCALE[0] + SCALE[1], rtol=1e-8)
+    assert "\n".join(lines[end + 1 :]) == commands
+
+
+def test_itx_empty_columns(tmp_path):
+    filename = str(tmp_path / "empty.itx")
+    igor.write_itx(filename, [np.array([]), np.array([])], ["a", "b"])
+    with open(filename) as f:
+        assert f.read() == "IGOR\nWAVES\ta\tb\nBEGIN\nEND\n"
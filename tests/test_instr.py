@@ -0,0 +1,94 @@
+import pyvisa
+import pytest
+
+from instruments import instr
+
+
+@pytest.mark.parametrize(
+    "command, retryable",
+    [
+        ("*IDN?", True),
+        (":WAV:SEND?", True),
+        (":HIST:REC? MIN", True),
+        (":TRIG:MODE?;:ACQ:COUN?", True),
+        (":WAV:REC 0;:WAV:SEND?", False),
+        ("*TRG", False),
+        ("*OPC?", False),
+        ("*ESR?", False),
+        (":STAT:EEV?", False),
+        ("SYSTem:ERRor?", False),
+    ],
+)
+def test_is_retryable(command, retryable):
+    assert instr.is_retryable(command) is retryable
+
+
+def test_read_only_query_retried_after_recovery(visa_rm, make_driver):
+    d = make_driver()
+    visa_rm.answers["FREQ?"] = "5e9"
+    visa_rm.failures.append("FREQ?")
+    assert d.query("FREQ?") == "5e9"
+    assert len(visa_rm.opened) == 2
+    assert len(d.recoveries) == 1
+    assert d.metrics.reconnects == 1
+    assert d.metrics.timeouts == 1
+
+
+def test_setting_message_not_retried(visa_rm, make_driver):
+    d = make_driver()
+    visa_rm.failures.append("FREQ 5e9;FREQ?")
+    with pytest.raises(pyvisa.errors.VisaIOError):
+        d.query("FREQ 5e9;FREQ?")
+    # the session is recovered, but the message is not sent again
+    assert len(visa_rm.opened) == 2
+    assert "FREQ 5e9;FREQ?" not in visa_rm.opened[1].log
+
+
+def test_explicit_retry_overrides_default(visa_rm, make_driver):
+    d = make_driver()
+    visa_rm.failures.append("FREQ?")
+    with pytest.raises(pyvisa.errors.VisaIOError):
+        d.query("FREQ?", retry=False)
+    visa_rm.failures.append("INIT;*OPC?")
+    d.query("INIT;*OPC?", retry=True)
+    assert visa_rm.opened[-1].log[-1] == "INIT;*OPC?"
+
+
+def test_read_stb_not_retried(visa_rm, make_driver):
+    d = make_driver()
+    visa_rm.failures.append("read_stb")
+    with pytest.raises(pyvisa.errors.VisaIOError):
+        d.read_stb()
+    assert "read_stb" not in visa_rm.opened[-1].log
+
+
+def test_recovery_restores_cached_session_settings(visa_rm, make_driver):
+    d = make_driver()
+    d.visa_instr.timeout = 12345
+    d.visa_instr.read_termination = "\n"
+    failed = d.visa_instr.resource
+    # the failed session is not read back: its settings may be lost or invalid
+    failed.timeout = None
+    visa_rm.failures.append("FREQ?")
+    d.query("FREQ?")
+    session = d.visa_instr.resource
+    assert session is not failed and failed.closed
+    assert "<clear>" in failed.log
+    assert session.timeout == 12345
+    assert session.read_termination == "\n"
+
+
+def test_recovery_invalidates_driver_caches(visa_rm, make_driver):
+    d = make_driver()
+    visa_rm.failures.append("FREQ?")
+    d.query("FREQ?")
+    assert d.cache is None
+
+
+def test_no_recovery_when_disabled(visa_rm, make_driver):
+    d = make_driver()
+    d.auto_recover = False
+    visa_rm.failures.append("FREQ?")
+    with pytest.raises(pyvisa.errors.VisaIOError):
+        d.query("FREQ?")
+    assert len(visa_rm.opened) == 1
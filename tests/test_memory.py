@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from instruments import memory
+from instruments.trace import Trace
+
+
+@pytest.fixture
+def shared_budget(monkeypatch):
+    """Sets the shared budget on top of what other live accounts retain; restored afterwards"""
+    monkeypatch.setattr(memory, "_budget", None)
+    baseline = memory.total()
+    return lambda budget: memory.set_budget(baseline + budget)
+
+
+def test_lru_eviction_within_instrument_budget():
+    account = memory.MemoryAccount("A", budget=300)
+    evicted = []
+    for key in "abc":
+        account.add(key, 100, lambda key=key: evicted.append(key))
+    account.touch("a")
+    account.add("d", 100, lambda: evicted.append("d"))
+    assert evicted == ["b"]
+    assert list(account.entries()) == ["c", "a", "d"]
+    assert account.retained == 300
+    assert account.evictions == 1
+
+
+def test_update_remove_and_clear():
+    account = memory.MemoryAccount("A", budget=1000)
+    evicted = []
+    account.add("a", 100, lambda: evicted.append("a"))
+    account.add("a", 400, lambda: evicted.append("a"))
+    account.add("b", 200, lambda: evicted.append("b"))
+    assert account.entries() == {"a": 400, "b": 200}
+    account.remove("a")
+    assert account.retained == 200 and evicted == []
+    account.clear()
+    assert account.retained == 0 and evicted == ["b"]
+
+
+def test_latest_entry_kept_alone_over_budget():
+    account = memory.MemoryAccount("A", budget=100)
+    evicted = []
+    account.add("a", 50, lambda: evicted.append("a"))
+    account.add("big", 500, lambda: evicted.append("big"))
+    assert evicted == ["a"]
+    assert account.entries() == {"big": 500}
+
+
+def test_shared_budget_evicts_oldest_over_all_instruments(shared_budget):
+    first = memory.MemoryAccount("A")
+    second = memory.MemoryAccount("B")
+    evicted = []
+    first.add("a1", 100, lambda: evicted.append("a1"))
+    second.add("b1", 100, lambda: evicted.append("b1"))
+    first.add("a2", 100, lambda: evicted.append("a2"))
+    shared_budget(250)
+    assert evicted == ["a1"]
+    first.touch("a2")
+    second.add("b2", 100, lambda: evicted.append("b2"))
+    assert evicted == ["a1", "b1"]
+    assert memory.usage()["A"] == 100 and memory.usage()["B"] == 100
+
+
+def test_cache_dict():
+    account = memory.MemoryAccount("A", budget=2 * 800)
+    cache = memory.CacheDict(account, "f")
+    cache[1] = np.zeros(100)
+    cache[2] = np.zeros(100)
+    cache[1]
+    cache[3] = np.zeros(100)
+    assert sorted(cache) == [1, 3]
+    del cache[1]
+    assert account.entries() == {("f", 3): 800}
+    cache.clear()
+    assert account.retained == 0
+
+
+def test_trace_recomputes_values_after_eviction():
+    account = memory.MemoryAccount("A", budget=1000)
+    trace = Trace(1, account)
+    trace.set_codes(np.arange(100, dtype=np.int16), yrange=0.1, offset=0.5, divisor=1000.0)
+    expected = np.arange(100) * 1e-3 + 0.5
+    np.testing.assert_allclose(trace.y, expected)
+    # 200 bytes of codes + 800 bytes of values: the next entry evicts the codes, the values stay
+    account.add("other", 100, lambda: None)
+    assert trace.codes is None
+    np.testing.assert_allclose(trace.y, expected)
+    # without codes, evicted values are gone
+    account.add("big", 1000, lambda: None)
+    assert trace.y.size == 0
+
+
+def test_trace_time_axis_recomputed_after_eviction():
+    account = memory.MemoryAccount("A", budget=1000)
+    trace = Trace(1, account)
+    trace.set_codes(np.arange(100, dtype=np.int16))
+    trace.srate = 1e3
+    np.testing.assert_allclose(trace.x, np.arange(100) * 1e-3)
+    # the values evict the least recently used axis, the codes are kept
+    trace.y
+    assert trace._x is None and trace.codes is not None
+    np.testing.assert_allclose(trace.x, np.arange(100) * 1e-3)
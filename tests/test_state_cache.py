@@ -0,0 +1,47 @@
+import numpy as np
+
+from instruments import state_cache
+
+
+def test_round_trip(state_dir):
+    state = {"active_traces": [1, 3], "range": np.float64(1.2), "points": np.int64(401), "name": "Trc1"}
+    state_cache.save("GPIB0::7::INSTR", "YOKOGAWA,701210,0,F1.00", state)
+    loaded = state_cache.load("GPIB0::7::INSTR")
+    assert loaded == {"active_traces": [1, 3], "range": 1.2, "points": 401, "name": "Trc1"}
+    assert type(loaded["points"]) is int
+
+
+def test_keyed_by_idn_and_resource(state_dir):
+    state_cache.save("GPIB0::7::INSTR", "YOKOGAWA,701210,0,F1.00", {"x": 1})
+    assert state_cache.load("GPIB0::7::INSTR", "YOKOGAWA,701210,0,F1.00") == {"x": 1}
+    assert state_cache.load("GPIB0::7::INSTR", "YOKOGAWA,701210,1,F1.00") is None
+    assert state_cache.load("GPIB0::8::INSTR") is None
+    # resource names differing only by separators map to the same file, but are not confused
+    assert state_cache.load("GPIB0_7_INSTR") is None
+
+
+def test_missing_unreadable_and_forgotten(state_dir):
+    assert state_cache.load("GPIB0::7::INSTR") is None
+    state_cache.save("GPIB0::7::INSTR", None, {"x": 1})
+    with open(state_cache._path("GPIB0::7::INSTR"), "w") as f:
+        f.write("{truncated")
+    assert state_cache.load("GPIB0::7::INSTR") is None
+    state_cache.save("GPIB0::7::INSTR", None, {"x": 1})
+    state_cache.forget("GPIB0::7::INSTR")
+    assert state_cache.load("GPIB0::7::INSTR") is None
+
+
+def test_driver_warm_restart_keyed_by_idn(visa_rm, make_driver):
+    d = make_driver()
+    d.channel = 3
+    d.clean()
+    assert d.visa_instr.closed
+
+    other = make_driver()
+    assert other.load_state(other.idn)
+    assert other.channel == 3
+
+    visa_rm.answers["*IDN?"] = "FAKE,OTHER UNIT,1,1.0"
+    replaced = make_driver()
+    assert not replaced.load_state(replaced.idn)
+    assert replaced.channel == 1